@@ -0,0 +1,362 @@
+"""Record/replay stand-ins for Exa, the OpenAI Assistants API and gspread worksheets.
+
+Replay fakes serve recorded fixtures where they have them and deterministic
+synthetic data otherwise, sleeping for an injected latency on every call so
+the pipeline's concurrency behaves as it would against the live services.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import itertools
+from datetime import datetime, timedelta
+
+from gspread.utils import a1_to_rowcol
+
+from ratelimit import get_rate_limiter
+
+
+class Latency:
+    """Sleeps for ``seconds``, varied by up to ``jitter`` (a fraction) either way."""
+
+    def __init__(self, seconds=0.0, jitter=0.0, seed=0):
+        self.seconds = seconds
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        if self.seconds <= 0:
+            return
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(self.seconds * factor)
+
+
+class Fixtures:
+    """Recorded Exa results and assistant replies, stored as one JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.exa = {}
+        self.assistants = {}
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                self.exa = data.get("exa", {})
+                self.assistants = data.get("assistants", {})
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def reply_key(assistant_id, content):
+        return hashlib.md5(f"{assistant_id}\n{content}".encode()).hexdigest()
+
+    def record_search(self, query, results):
+        with self._lock:
+            self.exa[query] = [result.to_dict() for result in results]
+
+    def record_reply(self, assistant_id, content, reply):
+        with self._lock:
+            self.assistants[self.reply_key(assistant_id, content)] = reply
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            with open(self.path, "w", encoding="utf-8") as file:
+                json.dump({"exa": self.exa, "assistants": self.assistants}, file, indent=2)
+
+
+###########
+## EXA ##
+###########
+
+class FakeResult:
+    """The fields of an Exa result the pipeline reads."""
+
+    def __init__(self, url, title, text, published_date):
+        self.url = url
+        self.title = title
+        self.text = text
+        self.published_date = published_date
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["url"], data.get("title"), data.get("text"), data.get("published_date"))
+
+    def to_dict(self):
+        return {"url": self.url, "title": self.title, "text": self.text, "published_date": self.published_date}
+
+
+class FakeSearchResponse:
+    def __init__(self, results):
+        self.results = results
+
+
+TALKING_POINTS = [
+    "Rich nations keep dodging their climate finance pledges while developing countries pay the price",
+    "The COP29 host is using the summit to sign new oil and gas deals",
+    "The loss and damage fund is an empty promise with almost no money in it",
+    "Carbon markets let polluters buy their way out of cutting emissions",
+    "Adaptation funding for small island states is nowhere near what they need",
+    "Fossil fuel lobbyists outnumber delegates from the most vulnerable countries",
+    "Climate activists are being silenced around the conference venue",
+    "Renewable energy jobs are growing faster than anyone predicted",
+]
+FILLER = [
+    "honestly", "again", "this week", "in Baku", "at #COP29", "right now", "as usual", "and nobody is talking about it",
+    "read the thread", "wake up", "the numbers are clear", "this has to change",
+]
+
+
+def synthetic_results(query, count, seed=0, duplicate_rate=0.2):
+    """Deterministic tweet-like results for a query, some of them retweets of earlier ones."""
+    generator = random.Random(f"{seed}:{query}")
+    published = datetime(2024, 11, 20)
+    results = []
+    for position in range(count):
+        if results and generator.random() < duplicate_rate:
+            original = generator.choice(results)
+            text = f"RT @{generator.choice(['cop_watch', 'climate_now', 'baku_live'])}: {original.text}"
+        else:
+            point = generator.choice(TALKING_POINTS)
+            words = generator.sample(FILLER, 3)
+            text = f"{point}, {words[0]} {words[1]}. {query} {words[2]} #{position}"
+        url_id = hashlib.md5(f"{seed}:{query}:{position}".encode()).hexdigest()[:12]
+        results.append(FakeResult(
+            url=f"https://x.com/user/status/{url_id}",
+            title=f"Post about {query}",
+            text=text,
+            published_date=(published - timedelta(minutes=position)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        ))
+    return results
+
+
+class ReplayExa:
+    """Exa client serving recorded results, or synthetic ones for unrecorded queries."""
+
+    def __init__(self, fixtures, latency, seed=0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.seed = seed
+
+    def search_and_contents(self, query, num_results=10, **kwargs):
+        self.latency.sleep()
+        recorded = self.fixtures.exa.get(query)
+        if recorded is not None:
+            return FakeSearchResponse([FakeResult.from_dict(result) for result in recorded[:num_results]])
+        return FakeSearchResponse(synthetic_results(query, num_results, self.seed))
+
+
+class RecordingExa:
+    """Wraps a live Exa client, recording each query's results into the fixtures."""
+
+    def __init__(self, exa, fixtures):
+        self.exa = exa
+        self.fixtures = fixtures
+
+    def search_and_contents(self, query, **kwargs):
+        response = self.exa.search_and_contents(query, **kwargs)
+        self.fixtures.record_search(query, [
+            FakeResult(result.url, result.title, result.text, result.published_date) for result in response.results
+        ])
+        return response
+
+
+################
+## ASSISTANTS ##
+################
+
+def synthetic_reply(assistant_id, content, identification_assistant_id):
+    """A plausible assistant reply: classifications for the identifier, prose otherwise."""
+    if assistant_id != identification_assistant_id:
+        return f"Here is some context worth adding to this conversation ({hashlib.md5(content.encode()).hexdigest()[:6]})."
+
+    def classify(artefact):
+        text = artefact.get("content") or ""
+        point = next((point for point in TALKING_POINTS if point[:40] in text), text[:80])
+        return {
+            "title": point[:60],
+            "narrative": point,
+            "community": "Climate policy observers",
+        }
+
+    context = json.loads(content)
+    if "artefacts" in context:
+        return json.dumps([dict(classify(artefact), id=artefact.get("id")) for artefact in context["artefacts"]])
+    return json.dumps(classify(context))
+
+
+class _Namespace:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeOpenAI:
+    """The slice of the OpenAI client used by the Assistants backend.
+
+    Thread and message creation cost one ``request_latency`` each; a run costs
+    ``run_latency``, standing in for the model's generation and the polling.
+    Every request waits for the shared "openai" rate limiter at the calling
+    thread's priority and reports back to it, as the real client's hooks do.
+    """
+
+    def __init__(self, fixtures, identification_assistant_id, run_latency, request_latency):
+        self.fixtures = fixtures
+        self.identification_assistant_id = identification_assistant_id
+        self.run_latency = run_latency
+        self.request_latency = request_latency
+        self.limiter = get_rate_limiter("openai")
+        self.threads = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        threads = _Namespace(
+            create=self._create_thread,
+            messages=_Namespace(create=self._create_message, list=self._list_messages),
+            runs=_Namespace(create_and_poll=self._create_and_poll),
+        )
+        self.beta = _Namespace(threads=threads)
+
+    def _request(self, latency):
+        self.limiter.acquire()
+        latency.sleep()
+        self.limiter.update_from_headers(200, {})
+        self.limiter.success()
+
+    def _create_thread(self):
+        self._request(self.request_latency)
+        with self._lock:
+            thread_id = f"thread_{next(self._ids)}"
+            self.threads[thread_id] = []
+        return _Namespace(id=thread_id)
+
+    def _create_message(self, thread_id, role, content):
+        self._request(self.request_latency)
+        with self._lock:
+            self.threads[thread_id].append((role, content))
+
+    def _create_and_poll(self, thread_id, assistant_id):
+        self._request(self.run_latency)
+        with self._lock:
+            content = self.threads[thread_id][-1][1]
+        reply = self.fixtures.assistants.get(Fixtures.reply_key(assistant_id, content))
+        if reply is None:
+            reply = synthetic_reply(assistant_id, content, self.identification_assistant_id)
+        with self._lock:
+            self.threads[thread_id].append(("assistant", reply))
+        return _Namespace(status="completed", last_error=None)
+
+    def _list_messages(self, thread_id):
+        self._request(self.request_latency)
+        with self._lock:
+            messages = list(reversed(self.threads[thread_id]))
+        return _Namespace(data=[
+            _Namespace(role=role, content=[_Namespace(text=_Namespace(value=content))])
+            for role, content in messages
+        ])
+
+
+class RecordingBackend:
+    """Wraps a live assistant backend, recording each reply into the fixtures."""
+
+    def __init__(self, backend, fixtures):
+        self.backend = backend
+        self.fixtures = fixtures
+
+    def run(self, assistant_id, context, **kwargs):
+        reply = self.backend.run(assistant_id, context, **kwargs)
+        self.fixtures.record_reply(assistant_id, json.dumps(context), reply)
+        return reply
+
+    def stream(self, assistant_id, context, **kwargs):
+        yield self.run(assistant_id, context, **kwargs)
+
+
+############
+## SHEETS ##
+############
+
+class FakeWorksheet:
+    """In-memory worksheet supporting the calls the dashboard makes."""
+
+    def __init__(self, headers, rows=None, latency=None):
+        self.values = [list(headers)] + [list(row) for row in rows or []]
+        self.latency = latency or Latency()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        self.latency.sleep()
+        with self._lock:
+            self.calls += 1
+
+    @staticmethod
+    def _text(value):
+        if value is True:
+            return "TRUE"
+        if value is False:
+            return "FALSE"
+        return "" if value is None else str(value)
+
+    def get_all_values(self):
+        self._call()
+        with self._lock:
+            return [[self._text(value) for value in row] for row in self.values]
+
+    def get_all_records(self, **kwargs):
+        self._call()
+        with self._lock:
+            headers = self.values[0]
+            return [
+                dict(zip(headers, list(row) + [""] * (len(headers) - len(row))))
+                for row in self.values[1:]
+            ]
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._call()
+        with self._lock:
+            self.values.extend(list(row) for row in values)
+
+    def update_cell(self, row, col, value):
+        self._call()
+        with self._lock:
+            self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self._call()
+        with self._lock:
+            for block in data:
+                start = block["range"].split(":")[0]
+                row, col = a1_to_rowcol(start)
+                for row_offset, values in enumerate(block["values"]):
+                    for col_offset, value in enumerate(values):
+                        self._set(row + row_offset, col + col_offset, value)
+
+    def _set(self, row, col, value):
+        while len(self.values) < row:
+            self.values.append([])
+        cells = self.values[row - 1]
+        cells.extend([""] * (col - len(cells)))
+        cells[col - 1] = value
+
+
+def fake_sheets(worksheets, latency):
+    """Fake worksheets for each ``{name: {"headers": [...]}}`` entry, plus sample threads and hashtags."""
+    sheets = {name: FakeWorksheet(schema["headers"], latency=latency) for name, schema in worksheets.items()}
+    if "threads" in sheets:
+        sheets["threads"].values.extend(
+            [f"Thread {position + 1}", point, f"https://x.com/thread/{position + 1}"]
+            for position, point in enumerate(TALKING_POINTS)
+        )
+    if "hashtags" in sheets:
+        sheets["hashtags"].values.extend([[tag] for tag in ["#COP29", "#ClimateFinance", "#LossAndDamage", "#FossilFuels"]])
+    return sheets
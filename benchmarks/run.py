@@ -0,0 +1,298 @@
+"""Offline benchmark of the listen -> classify -> respond -> archive pipeline.
+
+Replays recorded (or synthetic) Exa results, assistant replies and worksheets
+with injected latency, at every combination of result count and concurrency,
+and writes a JSON report tagged with the current commit. Run from the
+repository root with a ``.streamlit/secrets.toml`` in place (a copy of the
+example file is enough for replay):
+
+    python -m benchmarks.run --results 20,100 --workers 1,4,8
+    python -m benchmarks.run --compare benchmarks/results/old.json benchmarks/results/new.json
+    python -m benchmarks.run --record benchmarks/fixtures/recorded.json   # live services
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import datetime
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+import database
+import listen
+import llm
+import respond
+import storage
+import sync
+from config import RESPONSE_STRATEGIES
+from metrics import get_span_summary, reset_metrics
+from benchmarks.fakes import (
+    Fixtures, Latency, ReplayExa, RecordingExa, FakeOpenAI, RecordingBackend, fake_sheets,
+)
+
+DEFAULT_PHRASES = ["climate finance", "loss and damage", "fossil fuels", "carbon markets"]
+STAGES = ["listen", "classify", "respond", "archive"]
+REPORT_SPANS = ["exa.search", "identify", "identify.batch", "respond", "llm.run", "sheets", "ratelimit.wait"]
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip())
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Fake worksheets of the current run; each run starts from a fresh spreadsheet
+_sheets = {}
+
+
+def install_fakes(args, fixtures, record=False):
+    """Point the pipeline at the fakes; in record mode only Sheets is faked."""
+    for module in (database, storage, sync):
+        module.get_sheets = lambda: _sheets
+
+    if not args.warm_cache:
+        # Every run classifies from scratch instead of hitting the on-disk cache
+        listen.get_cached_classification = lambda *args, **kwargs: None
+        listen.store_classification = lambda *args, **kwargs: None
+
+    if record:
+        backend = RecordingBackend(llm.get_llm_backend(), fixtures)
+    else:
+        client = FakeOpenAI(
+            fixtures,
+            st.secrets["openai"]["narrative_identification_assistant_id"],
+            run_latency=Latency(args.openai_latency, args.jitter, seed=1),
+            request_latency=Latency(args.openai_request_latency, args.jitter, seed=2),
+        )
+        llm.get_openai_client = lambda *args, **kwargs: client
+        backend = llm.AssistantsBackend()
+    listen.get_llm_backend = lambda *args, **kwargs: backend
+    respond.get_llm_backend = lambda *args, **kwargs: backend
+
+
+def archive_rows(narratives, responses):
+    """Worksheet rows for the archived narratives and responses, as the dashboard writes them."""
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    narrative_rows = [
+        [n["hash"], n.get("title", ""), n.get("narrative", ""), n.get("community", ""), n["link"], n["content"], "", now]
+        for n in narratives
+    ]
+    response_rows = [
+        [narrative["hash"], now, narrative.get("title", ""), narrative["content"], narrative["link"],
+         response["content"], strategy, "", "", False, 0, 0, 0]
+        for narrative, strategy, response in responses
+    ]
+    return narrative_rows, response_rows
+
+
+def run_pipeline(args, exa, result_count, workers, database_path):
+    """Run the pipeline once and return per-stage timings."""
+    stages = {}
+    _sheets.clear()
+    _sheets.update(fake_sheets(storage.WORKSHEETS, Latency(args.sheets_latency, args.jitter, seed=3)))
+
+    listening_model = {
+        "listening_tags": args.phrases,
+        "num_results": result_count,
+        "search_type": "auto",
+        "use_autoprompt": False,
+        "livecrawl": "never",
+        "fan_out_search": True,
+        "incremental_search": False,
+    }
+    start = time.perf_counter()
+    results, _, _ = listen.sweep_listening_model(listening_model, days=7, exa=exa)
+    stages["listen"] = {"seconds": time.perf_counter() - start, "items": len(results)}
+
+    start = time.perf_counter()
+    narratives = list(listen.parse_narrative_artefact(
+        results, max_workers=workers, batch_size=args.batch_size, processed_hashes=set()
+    ))
+    stages["classify"] = {"seconds": time.perf_counter() - start, "items": len(narratives)}
+
+    start = time.perf_counter()
+    responses = []
+    to_answer = narratives[:args.responses]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (narrative, executor.submit(
+                lambda narrative: list(respond.generate_response_variants(
+                    narrative, list(RESPONSE_STRATEGIES), ["Default"], ["English"], max_workers=workers
+                )),
+                narrative,
+            ))
+            for narrative in to_answer
+        ]
+        for narrative, future in futures:
+            for strategy, _, _, response_obj, _ in future.result():
+                if response_obj:
+                    responses.append((narrative, strategy, response_obj))
+    stages["respond"] = {"seconds": time.perf_counter() - start, "items": len(responses)}
+
+    start = time.perf_counter()
+    store = storage.SqliteStorage(path=database_path, sync_to_sheets=True)
+    narrative_rows, response_rows = archive_rows(narratives, responses)
+    store.append_rows("narrative", narrative_rows)
+    store.append_rows("responses", response_rows)
+    if response_rows:
+        store.update_rows("responses", {2: {10: True}})
+    # Drain the outbox here instead of on the worker thread so the push is timed
+    store.sync.sync_pending()
+    stages["archive"] = {"seconds": time.perf_counter() - start, "items": len(narrative_rows) + len(response_rows)}
+
+    for stage in stages.values():
+        stage["throughput"] = stage["items"] / stage["seconds"] if stage["seconds"] else 0.0
+    return stages
+
+
+def summarise(runs):
+    """Median stage timings and span percentiles across repeats of one configuration."""
+    summary = {"stages": {}, "spans": {}}
+    total = [sum(run["stages"][stage]["seconds"] for stage in STAGES) for run in runs]
+    summary["total_seconds"] = statistics.median(total)
+    for stage in STAGES:
+        summary["stages"][stage] = {
+            key: statistics.median(run["stages"][stage][key] for run in runs)
+            for key in ("seconds", "items", "throughput")
+        }
+    names = {span["span"] for run in runs for span in run["spans"]}
+    for name in names:
+        rows = [span for run in runs for span in run["spans"] if span["span"] == name]
+        summary["spans"][name] = {
+            "calls": statistics.median(row["calls"] for row in rows),
+            "errors": sum(row["errors"] for row in rows),
+            "p50": statistics.median(row["p50"] for row in rows),
+            "p95": statistics.median(row["p95"] for row in rows),
+        }
+    return summary
+
+
+def print_summary(configurations):
+    print(f"{'results':>7} {'workers':>7} {'total':>8} " + " ".join(f"{stage:>16}" for stage in STAGES))
+    for configuration in configurations:
+        summary = configuration["summary"]
+        cells = [
+            f"{summary['stages'][stage]['seconds']:6.2f}s {summary['stages'][stage]['throughput']:6.1f}/s"
+            for stage in STAGES
+        ]
+        print(f"{configuration['results']:>7} {configuration['workers']:>7} {summary['total_seconds']:7.2f}s " + " ".join(f"{cell:>16}" for cell in cells))
+        spans = summary["spans"]
+        details = [
+            f"{name} p50={spans[name]['p50']:.2f}s p95={spans[name]['p95']:.2f}s"
+            for name in REPORT_SPANS if name in spans
+        ]
+        print(" " * 16 + "; ".join(details))
+
+
+def compare(old_path, new_path):
+    """Print the change in stage times and throughput between two reports."""
+    with open(old_path, "r", encoding="utf-8") as file:
+        old = json.load(file)
+    with open(new_path, "r", encoding="utf-8") as file:
+        new = json.load(file)
+    print(f"{old['commit']} -> {new['commit']}")
+    old_configurations = {(c["results"], c["workers"]): c["summary"] for c in old["configurations"]}
+    for configuration in new["configurations"]:
+        key = (configuration["results"], configuration["workers"])
+        before = old_configurations.get(key)
+        if before is None:
+            continue
+        after = configuration["summary"]
+
+        def change(old_value, new_value):
+            return f"{(new_value - old_value) / old_value:+.0%}" if old_value else "n/a"
+
+        cells = [
+            f"{stage} {change(before['stages'][stage]['seconds'], after['stages'][stage]['seconds'])}"
+            for stage in STAGES
+        ]
+        print(f"results={key[0]} workers={key[1]}: total "
+              f"{before['total_seconds']:.2f}s -> {after['total_seconds']:.2f}s "
+              f"({change(before['total_seconds'], after['total_seconds'])}); " + ", ".join(cells))
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the narrative pipeline")
+    parser.add_argument("--results", type=parse_list, default=[10, 50], help="Exa results per phrase, comma separated")
+    parser.add_argument("--workers", type=parse_list, default=[1, 4, 8], help="Concurrency levels, comma separated")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration")
+    parser.add_argument("--phrases", nargs="+", default=DEFAULT_PHRASES, help="Listening phrases, searched one by one")
+    parser.add_argument("--responses", type=int, default=5, help="Narratives answered with every strategy per run")
+    parser.add_argument("--batch-size", type=int, default=1, help="Artefacts per identification call")
+    parser.add_argument("--exa-latency", type=float, default=0.8, help="Seconds per Exa search")
+    parser.add_argument("--openai-latency", type=float, default=1.5, help="Seconds per assistant run")
+    parser.add_argument("--openai-request-latency", type=float, default=0.15, help="Seconds per other OpenAI request")
+    parser.add_argument("--sheets-latency", type=float, default=0.3, help="Seconds per worksheet call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency variation, as a fraction")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic search results")
+    parser.add_argument("--fixtures", default="benchmarks/fixtures/recorded.json", help="Recorded fixtures to replay")
+    parser.add_argument("--warm-cache", action="store_true", help="Use the on-disk classification cache")
+    parser.add_argument("--output", default="benchmarks/results", help="Directory for the JSON report")
+    parser.add_argument("--record", metavar="PATH", help="Run once against live Exa and OpenAI, recording fixtures to PATH")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.record:
+        from clients import get_exa_client
+        fixtures = Fixtures(args.record)
+        install_fakes(args, fixtures, record=True)
+        with tempfile.TemporaryDirectory() as directory:
+            run_pipeline(args, RecordingExa(get_exa_client(), fixtures), args.results[0], args.workers[0],
+                         os.path.join(directory, "benchmark.db"))
+        fixtures.save()
+        print(f"Recorded {len(fixtures.exa)} searches and {len(fixtures.assistants)} assistant replies to {args.record}")
+        return
+
+    fixtures = Fixtures(args.fixtures)
+    install_fakes(args, fixtures)
+    exa = ReplayExa(fixtures, Latency(args.exa_latency, args.jitter, seed=4), seed=args.seed)
+
+    configurations = []
+    with tempfile.TemporaryDirectory() as directory:
+        for result_count in args.results:
+            for workers in args.workers:
+                runs = []
+                for repeat in range(args.repeat):
+                    reset_metrics()
+                    database_path = os.path.join(directory, f"benchmark-{result_count}-{workers}-{repeat}.db")
+                    stages = run_pipeline(args, exa, result_count, workers, database_path)
+                    runs.append({"stages": stages, "spans": get_span_summary()})
+                configurations.append({
+                    "results": result_count,
+                    "workers": workers,
+                    "runs": runs,
+                    "summary": summarise(runs),
+                })
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("compare", "record")},
+        "configurations": configurations,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+    print_summary(configurations)
+    print(f"Report written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import sqlite3
+
+from config import (
+    CLASSIFICATION_CACHE_FILE,
+    CLASSIFICATION_CACHE_TTL,
+    CLASSIFICATION_CACHE_MAX_ENTRIES,
+)
+
+
+def get_cache_connection(path=CLASSIFICATION_CACHE_FILE):
+    """Open the classification cache database, creating it if needed."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS classifications (
+            content_hash TEXT NOT NULL,
+            assistant_id TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (content_hash, assistant_id)
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_classifications_last_access ON classifications (last_access)"
+    )
+    return conn
+
+
+def get_cached_classification(content_hash, assistant_id, ttl=CLASSIFICATION_CACHE_TTL):
+    """Return the cached assistant result for a content hash, or None on a miss."""
+    try:
+        conn = get_cache_connection()
+        try:
+            row = conn.execute(
+                "SELECT result, created_at FROM classifications WHERE content_hash = ? AND assistant_id = ?",
+                (content_hash, assistant_id)
+            ).fetchone()
+            if row is None:
+                return None
+
+            result, created_at = row
+            now = time.time()
+            if now - created_at > ttl:
+                conn.execute(
+                    "DELETE FROM classifications WHERE content_hash = ? AND assistant_id = ?",
+                    (content_hash, assistant_id)
+                )
+                conn.commit()
+                return None
+
+            conn.execute(
+                "UPDATE classifications SET last_access = ? WHERE content_hash = ? AND assistant_id = ?",
+                (now, content_hash, assistant_id)
+            )
+            conn.commit()
+            return json.loads(result)
+        finally:
+            conn.close()
+    except (sqlite3.Error, json.JSONDecodeError) as e:
+        print(f"Error reading classification cache: {e}")
+        return None
+
+
+def store_classification(content_hash, assistant_id, result,
+                         ttl=CLASSIFICATION_CACHE_TTL,
+                         max_entries=CLASSIFICATION_CACHE_MAX_ENTRIES):
+    """Store an assistant result and evict expired or least recently used entries."""
+    try:
+        conn = get_cache_connection()
+        try:
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?)",
+                (content_hash, assistant_id, json.dumps(result), now, now)
+            )
+            conn.execute("DELETE FROM classifications WHERE created_at < ?", (now - ttl,))
+            conn.execute(
+                """
+                DELETE FROM classifications WHERE rowid IN (
+                    SELECT rowid FROM classifications
+                    ORDER BY last_access DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (max_entries,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error writing classification cache: {e}")
@@ -1,12 +1,167 @@
+import threading
+
+import httpx
+import requests
 import streamlit as st
 from exa_py import Exa
 from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import CLIENT_POOL_SIZE, CLIENT_TIMEOUT, CLIENT_MAX_RETRIES, CLIENT_BACKOFF_FACTOR
+from ratelimit import get_rate_limiter
+
+# Process-wide clients keyed by (service, api key, base url), shared by every session
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class ClientStats:
+    """Counts requests and newly opened connections for one pooled client."""
+
+    def __init__(self, service, api_key, base_url=None):
+        self.service = service
+        self.key_hint = f"...{api_key[-4:]}" if api_key else "none"
+        self.base_url = base_url
+        self.lookups = 0
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def count(self, requests=0, connections=0):
+        with self._lock:
+            self.requests += requests
+            self.connections += connections
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "service": self.service,
+                "api_key": self.key_hint,
+                "base_url": self.base_url or "default",
+                "lookups": self.lookups,
+                "requests": self.requests,
+                "connections": self.connections,
+                "reused": max(0, self.requests - self.connections),
+            }
+
+
+class ExaRequestError(ValueError):
+    """A failed Exa request, carrying the status and headers the retry scheduler reads."""
+
+    def __init__(self, status_code, headers, text):
+        super().__init__(f"Request failed with status code {status_code}: {text}")
+        self.status_code = status_code
+        self.headers = headers
+
+
+class PooledExa(Exa):
+    """Exa client that sends requests through a keep-alive session with retries.
+
+    The session only retries connection errors. Error statuses are raised to
+    the caller, whose ``call_with_retry`` backs off through the shared "exa"
+    rate limiter, so each search is retried in one place.
+    """
+
+    def __init__(self, api_key, stats):
+        super().__init__(api_key)
+        self.stats = stats
+        self.session = requests.Session()
+        retry = Retry(
+            total=CLIENT_MAX_RETRIES,
+            backoff_factor=CLIENT_BACKOFF_FACTOR,
+            status=0,
+            allowed_methods=None,  # Exa searches are POSTs and safe to repeat
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CLIENT_POOL_SIZE, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, endpoint, data):
+        res = self.session.post(self.base_url + endpoint, json=data, headers=self.headers, timeout=CLIENT_TIMEOUT)
+        if res.status_code != 200:
+            raise ExaRequestError(res.status_code, res.headers, res.text)
+        get_rate_limiter("exa").update_from_headers(res.status_code, res.headers)
+        return res.json()
+
+    def pool_counts(self):
+        """Requests sent and connections opened, as counted by the session's urllib3 pools."""
+        requests_sent = 0
+        connections = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_sent += pool.num_requests
+                    connections += pool.num_connections
+        return requests_sent, connections
+
+
+def _build_openai_client(api_key, base_url, stats):
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            stats.count(connections=1)
+
+    limiter = get_rate_limiter("openai")
+
+    def on_request(request):
+        # Every request, including the SDK's own retries, waits its turn at the
+        # calling thread's priority
+        limiter.acquire()
+        stats.count(requests=1)
+        request.extensions["trace"] = trace
+
+    def on_response(response):
+        limiter.update_from_headers(response.status_code, response.headers)
+        if response.status_code < 400:
+            limiter.success()
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=CLIENT_POOL_SIZE, max_keepalive_connections=CLIENT_POOL_SIZE),
+        timeout=CLIENT_TIMEOUT,
+        event_hooks={"request": [on_request], "response": [on_response]},
+    )
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=CLIENT_MAX_RETRIES, http_client=http_client)
+
+
+def _get_pooled_client(service, api_key, base_url, factory):
+    key = (service, api_key, base_url)
+    with _clients_lock:
+        if key not in _clients:
+            stats = ClientStats(service, api_key, base_url)
+            _clients[key] = (factory(stats), stats)
+        client, stats = _clients[key]
+        stats.lookups += 1
+        return client
+
 
 def get_exa_client():
     """Get or create Exa client instance"""
     api_key = st.session_state.get("exa_api_key") or st.secrets["exa"]["api_key"]
-    return Exa(api_key)
+    return _get_pooled_client("exa", api_key, None, lambda stats: PooledExa(api_key, stats))
 
-def get_openai_client():
+
+def get_openai_client(api_key=None, base_url=None):
     """Get or create OpenAI client instance"""
-    return OpenAI(api_key=st.secrets["openai"]["api_key"])
+    api_key = api_key or st.secrets["openai"]["api_key"]
+    return _get_pooled_client(
+        "openai", api_key, base_url, lambda stats: _build_openai_client(api_key, base_url, stats)
+    )
+
+
+def get_client_stats():
+    """Request and connection-reuse counters for every pooled client."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    summary = []
+    for client, stats in clients:
+        if isinstance(client, PooledExa):
+            # urllib3 keeps its own request and connection counts
+            requests_sent, connections = client.pool_counts()
+            with stats._lock:
+                stats.requests = requests_sent
+                stats.connections = connections
+        summary.append(stats.as_dict())
+    return summary
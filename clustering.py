@@ -0,0 +1,123 @@
+import math
+import datetime
+from collections import Counter
+
+from config import NARRATIVE_CLUSTER_THRESHOLD
+from retrieval import tokenize
+
+
+def narrative_text(narrative):
+    """The classifier output a narrative is clustered on."""
+    return f"{narrative.get('title', '')} {narrative.get('narrative', '')}"
+
+
+def found_at(narrative):
+    """When a narrative was found, or now for narratives found before this was recorded."""
+    try:
+        return datetime.datetime.fromisoformat(narrative.get("found_at") or "")
+    except ValueError:
+        return datetime.datetime.now()
+
+
+class NarrativeCluster:
+    """Narratives sharing a talking point, led by the first one that started the cluster."""
+
+    def __init__(self, cluster_id, narrative):
+        self.id = cluster_id
+        self.representative = narrative
+        self.members = []
+        self.centroid = Counter()  # Sum of member vectors
+        self.norm = 0.0
+
+    def add(self, narrative, vector):
+        self.members.append((narrative["hash"], found_at(narrative)))
+        self.centroid.update(vector)
+        self.norm = math.sqrt(sum(weight * weight for weight in self.centroid.values()))
+
+    def similarity(self, vector):
+        if not self.norm:
+            return 0.0
+        return sum(weight * self.centroid.get(term, 0.0) for term, weight in vector.items()) / self.norm
+
+    def top_terms(self, k=5):
+        return [term for term, _ in self.centroid.most_common(k)]
+
+    def counts_by_day(self):
+        return Counter(seen.date() for _, seen in self.members)
+
+    def trend(self, now=None, window=datetime.timedelta(hours=24), hashes=None):
+        """Members found in the last ``window`` and in the window before it, counting only ``hashes`` if given."""
+        now = now or datetime.datetime.now()
+        seen_at = [seen for member, seen in self.members if hashes is None or member in hashes]
+        recent = sum(1 for seen in seen_at if now - seen <= window)
+        previous = sum(1 for seen in seen_at if window < now - seen <= 2 * window)
+        return recent, previous
+
+
+class NarrativeClusterer:
+    """Incremental single-pass clustering of identified narratives.
+
+    Each narrative's TF-IDF vector joins the cluster whose centroid it is most
+    cosine-similar to, if that reaches ``threshold``, and starts a new cluster
+    otherwise. Only clusters sharing a term with the narrative are compared,
+    through an inverted index of centroid terms, so adding a narrative stays
+    cheap as clusters accumulate.
+    """
+
+    def __init__(self, threshold=NARRATIVE_CLUSTER_THRESHOLD):
+        self.threshold = threshold
+        self.clusters = []
+        self.assignments = {}  # narrative hash -> cluster id
+        self.document_frequency = Counter()
+        self.documents = 0
+        self.postings = {}  # term -> ids of clusters whose centroid contains it
+
+    def vectorize(self, counts):
+        vector = {
+            term: frequency * (math.log((1 + self.documents) / (1 + self.document_frequency[term])) + 1)
+            for term, frequency in counts.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def add(self, narrative):
+        """Assign a narrative to a cluster and return the cluster."""
+        if narrative["hash"] in self.assignments:
+            return self.clusters[self.assignments[narrative["hash"]]]
+
+        counts = Counter(tokenize(narrative_text(narrative)))
+        self.documents += 1
+        self.document_frequency.update(counts.keys())
+        vector = self.vectorize(counts)
+
+        candidates = set()
+        for term in vector:
+            candidates.update(self.postings.get(term, ()))
+        best, best_similarity = None, self.threshold
+        for cluster_id in candidates:
+            similarity = self.clusters[cluster_id].similarity(vector)
+            if similarity >= best_similarity:
+                best, best_similarity = self.clusters[cluster_id], similarity
+
+        if best is None:
+            best = NarrativeCluster(len(self.clusters), narrative)
+            self.clusters.append(best)
+        best.add(narrative, vector)
+        for term in vector:
+            self.postings.setdefault(term, set()).add(best.id)
+        self.assignments[narrative["hash"]] = best.id
+        return best
+
+    def update(self, narratives):
+        """Cluster every narrative not seen before."""
+        for narrative in narratives:
+            if narrative["hash"] not in self.assignments:
+                self.add(narrative)
+
+    def largest(self, hashes=None):
+        """Clusters by number of members, counting only ``hashes`` if given."""
+        def size(cluster):
+            if hashes is None:
+                return len(cluster.members)
+            return sum(1 for member, _ in cluster.members if member in hashes)
+        return sorted((cluster for cluster in self.clusters if size(cluster)), key=size, reverse=True)
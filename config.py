@@ -2,6 +2,104 @@ import streamlit as st
 
 SEARCH_CARD_TEMPLATE_FILE = "templates/search_result_card.html"
 
+# Maximum number of identification assistant runs in flight at once
+IDENTIFICATION_MAX_WORKERS = st.secrets["openai"].get("identification_max_workers", 4)
+
+# Artefacts packed into one identification call (1 disables batching), capped by an estimated prompt token budget
+IDENTIFICATION_BATCH_SIZE = st.secrets["openai"].get("identification_batch_size", 1)
+IDENTIFICATION_BATCH_TOKEN_BUDGET = st.secrets["openai"].get("identification_batch_token_budget", 4000)
+
+# Pooled API clients: connections kept alive per client, request timeout (seconds) and retries with backoff
+CLIENT_POOL_SIZE = 20
+CLIENT_TIMEOUT = 60
+CLIENT_MAX_RETRIES = 3
+CLIENT_BACKOFF_FACTOR = 0.5
+
+# Concurrent Exa searches when fanning out one search per listening phrase
+SEARCH_MAX_WORKERS = st.secrets["exa"].get("max_workers", 8)
+
+# Requests per second allowed to each external service, shared by all threads
+RATE_LIMITS = {
+    "exa": st.secrets["exa"].get("requests_per_second", 5),
+    # Every HTTP request to OpenAI, including Assistants run polling
+    "openai": st.secrets["openai"].get("requests_per_second", 10),
+    # Google Sheets allows 60 requests per minute per user
+    "sheets": st.secrets.get("storage", {}).get("sheets_requests_per_second", 1),
+}
+
+# Throttled or failed calls: retries, jittered exponential backoff base and cap (seconds),
+# the lowest fraction of its configured rate a throttled service drops to,
+# and the fraction of that rate recovered after each successful call
+RATE_LIMIT_MAX_RETRIES = 4
+RATE_LIMIT_BACKOFF_BASE = 1.0
+RATE_LIMIT_BACKOFF_MAX = 60
+RATE_LIMIT_MIN_FRACTION = 0.1
+RATE_LIMIT_RECOVERY = 0.05
+
+# Seconds a local worksheet snapshot is served before Google Sheets is queried again
+SHEETS_CACHE_TTL = 120
+# Seconds the background Sheets writer waits to coalesce a burst of writes
+SHEETS_WRITE_COALESCE_DELAY = 0.5
+# Seconds the process waits at exit for queued Sheets writes to be applied
+SHEETS_WRITE_EXIT_TIMEOUT = 30
+
+# Local relevance prefilter for sheet data sent to the hashtag and link assistants.
+# Index type is "bm25" or "tfidf"; a top-k of 0 sends every row.
+RETRIEVAL_INDEX_TYPE = "bm25"
+HASHTAG_TOP_K = 40
+THREAD_TOP_K = 10
+# A local thread match is used without asking the link assistant when its topic
+# similarity reaches the threshold and beats the runner-up by the margin
+THREAD_MATCH_THRESHOLD = 0.35
+THREAD_MATCH_MARGIN = 0.1
+
+# Local SQLite database shared by the dashboard and the background listener
+LOCAL_STORE_FILE = "data/dashboard.db"
+
+# Where the Narrative Results, Responses, Threads and Hashtags tables live: "sqlite"
+# (LOCAL_STORE_FILE, optionally mirrored to Google Sheets in the background) or "sheets"
+STORAGE_BACKEND = st.secrets.get("storage", {}).get("backend", "sqlite")
+STORAGE_SYNC_TO_SHEETS = st.secrets.get("storage", {}).get("sync_to_sheets", True)
+# Seconds the Sheets sync worker sleeps when idle, and its backoff while Sheets fails
+SYNC_INTERVAL = 30
+SYNC_BACKOFF_BASE = 2
+SYNC_BACKOFF_MAX = 5 * 60
+
+# Seconds between sweeps of the background listener (listener.py)
+LISTENER_INTERVAL = 15 * 60
+# Most narratives stored by the listener that a dashboard session loads
+STORED_NARRATIVES_LIMIT = 1000
+
+# Near-duplicate artefacts are clustered before classification when the estimated
+# Jaccard similarity of their word shingles reaches the threshold (MinHash LSH)
+NEAR_DUPLICATE_THRESHOLD = 0.6
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+SHINGLE_SIZE = 3
+
+# Identified narratives join the cluster whose TF-IDF centroid they are at least this
+# cosine-similar to, or start a new one
+NARRATIVE_CLUSTER_THRESHOLD = 0.3
+
+# On-disk cache of identification assistant results, keyed by content hash
+CLASSIFICATION_CACHE_FILE = "data/classification_cache.db"
+CLASSIFICATION_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+CLASSIFICATION_CACHE_MAX_ENTRIES = 10000
+
+# Assistant backend: "assistants" (thread/run polling) or "chat" (single chat completion)
+LLM_BACKEND = st.secrets["openai"].get("backend", "assistants")
+# Optional OpenAI-compatible endpoint for the chat backend, e.g. a local stand-in server
+LLM_BASE_URL = st.secrets["openai"].get("base_url")
+LLM_API_KEY = st.secrets["openai"].get("base_url_api_key")
+
+# Pipeline spans: durations kept per span for percentiles, finished spans listed in the
+# Diagnostics tab, Prometheus histogram buckets (seconds), and the local port serving
+# /metrics for scraping (0 disables it)
+METRICS_SAMPLE_SIZE = 1000
+METRICS_RECENT_SPANS = 200
+METRICS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+METRICS_PORT = st.secrets.get("metrics", {}).get("port", 0)
+
 # Response strategies
 RESPONSE_STRATEGIES = {
     "Truth Query": st.secrets["openai"]["truth_query_assistant_id"],
@@ -9,6 +107,9 @@ RESPONSE_STRATEGIES = {
     "Combined": st.secrets["openai"]["combined_assistant_id"]
 }
 
+# Maximum number of response variants generated at once
+RESPONSE_MAX_WORKERS = st.secrets["openai"].get("response_max_workers", 6)
+
 VOICES = { "Default": "DEFAULT", "Sylva": st.secrets["openai"]["sylva_assistant_id"], "Khataza": st.secrets["openai"]["khataza_assistant_id"]}
 
 LANGUAGES = [
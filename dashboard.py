@@ -1,11 +1,23 @@
 import streamlit as st
 import os
-from database import setup_google_sheets, get_sheets
-from listen import parse_narrative_artefact, search_narrative_artefacts
+from database import build_row_index, get_failed_writes, retry_failed_writes, dismiss_failed_writes
+from storage import get_storage
+from listen import parse_narrative_artefact, search_narrative_artefacts, commit_listening_watermarks, get_listening_model
+from local_store import load_listening_model, save_listening_model, load_narratives, save_narratives
 import datetime
-from config import SEARCH_CARD_TEMPLATE_FILE, RESPONSE_STRATEGIES, VOICES, LANGUAGES
-from respond import generate_response
-from typed_dicts import NarrativeResponse, Response, OriginalPost
+import math
+import time
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from config import SEARCH_CARD_TEMPLATE_FILE, RESPONSE_STRATEGIES, VOICES, LANGUAGES, HASHTAG_TOP_K, THREAD_TOP_K, METRICS_PORT, STORED_NARRATIVES_LIMIT
+from retrieval import top_k_records, build_thread_lookup, match_thread
+from respond import generate_response, generate_response_variants, stream_response_variant, build_response_obj
+from llm import get_latency_summary
+from clients import get_client_stats
+from ratelimit import get_rate_limiter_stats
+from metrics import get_span_summary, get_recent_spans, prometheus_text, reset_metrics, start_metrics_server
+from typed_dicts import NarrativeResponse, Response, OriginalPost, ResponseRecord
+from narrative_store import create_narrative_results_store, create_narrative_responses_store
+from clustering import NarrativeClusterer
 narrative_sheet = None
 responses_sheet = None
 
@@ -19,6 +31,52 @@ def load_listening_tags():
 def save_listening_tags(tags_list):
     st.session_state.listening_tags = tags_list
 
+def restore_listening_model():
+    """Seed session state with the listening model saved by a previous session."""
+    stored_model = load_listening_model()
+    if stored_model:
+        for key, value in stored_model.items():
+            if key not in st.session_state:
+                st.session_state[key] = value
+
+def load_narrative_results():
+    """Load the narrative results store from session state."""
+    if "narrative_results" not in st.session_state:
+        st.session_state.narrative_results = create_narrative_results_store()
+    return st.session_state.narrative_results
+
+def load_narrative_clusters():
+    """Cluster any narratives added since the last rerun and return the clusterer.
+
+    "Insufficient Context" narratives all share that text, so they are left out.
+    """
+    if "narrative_clusters" not in st.session_state:
+        st.session_state.narrative_clusters = NarrativeClusterer()
+    clusterer = st.session_state.narrative_clusters
+    clusterer.update(load_narrative_results().view("sufficient_context"))
+    return clusterer
+
+def load_stored_narratives():
+    """Merge narratives stored by the background listener into session state.
+
+    Only the newest STORED_NARRATIVES_LIMIT narratives stored within the
+    search window (``days_input``) are loaded, so a session stays bounded
+    however long the listener runs.
+    """
+    narrative_results = load_narrative_results()
+    if "processed_hashes" not in st.session_state:
+        st.session_state.processed_hashes = set()
+
+    since = datetime.datetime.now() - datetime.timedelta(days=st.session_state.get("days_input", 7))
+    stored_narratives, last_id = load_narratives(
+        st.session_state.get("stored_narratives_id", 0), since=since.isoformat(), limit=STORED_NARRATIVES_LIMIT
+    )
+    st.session_state.stored_narratives_id = last_id
+
+    for narrative in stored_narratives:
+        narrative_results.add(narrative)
+        st.session_state.processed_hashes.add(narrative["hash"])
+
 def load_listening_responses():
     if 'listening_responses' not in st.session_state:
         st.session_state.listening_responses = []
@@ -30,14 +88,49 @@ def save_listening_responses(responses_list):
 
 def delete_response(title):
     """Delete a narrative from session state based on title."""
-    st.session_state.narrative_results = [
-        narrative for narrative in st.session_state.narrative_results if narrative["title"] != title
-    ]
+    narrative_results = load_narrative_results()
+    for narrative in narrative_results:
+        if narrative["title"] == title:
+            narrative_results.remove(narrative["hash"])
     st.success("Deleted successfully")
 
+# Streamlit reruns this script in a fresh module, so the cache must outlive it
+@st.cache_resource
 def load_card_template(file_path):
-    with open(file_path, "r", encoding="utf-8") as file:
-        return file.read()
+    """Compile a card template once per process, escaping every substituted value."""
+    directory, name = os.path.split(file_path)
+    environment = Environment(
+        loader=FileSystemLoader(directory or "."),
+        autoescape=select_autoescape(default=True, default_for_string=True),
+    )
+    return environment.get_template(name)
+
+def safe_link(link):
+    """Only let http(s) links into a card's href."""
+    link = str(link or "")
+    return link if link.startswith(("http://", "https://")) else "#"
+
+def render_narrative_card(narrative):
+    """Render a narrative's search card, memoized per narrative hash for the session.
+
+    The memo holds the values the card was rendered from, so an edited
+    narrative or a new duplicate renders the card again.
+    """
+    if 'card_html' not in st.session_state:
+        st.session_state.card_html = {}
+    fields = {
+        "title": narrative['title'],
+        "narrative": narrative.get('narrative', 'N/A'),
+        "community": narrative.get('community', 'N/A'),
+        "link": safe_link(narrative['link']),
+        "duplicates": [safe_link(link) for link in narrative.get('duplicates') or []],
+        "content": narrative['content'],
+    }
+    memo = st.session_state.card_html.get(narrative['hash'])
+    if memo is None or memo[0] != fields:
+        memo = (fields, load_card_template(SEARCH_CARD_TEMPLATE_FILE).render(**fields))
+        st.session_state.card_html[narrative['hash']] = memo
+    return memo[1]
     
 def handle_generate_thread(narrative, response_idx):
     try:    
@@ -46,28 +139,35 @@ def handle_generate_thread(narrative, response_idx):
         thread_data = load_thread_data_from_sheets()
 
 
-        # Filter out the 'Link' property from thread data
-        openai_thread_data = [{k: v for k, v in thread.items() if k != 'Link'} for thread in thread_data]
-        link_llm_context = {
-            "narrative": narrative['responses'][response_idx]['content'],
-            "thread_data": openai_thread_data
-        }
+        response_content = narrative['responses'][response_idx]['content']
+        threads_by_number = build_thread_lookup(thread_data)
 
-        link_res = generate_response(link_assistant_id, link_llm_context)
-        
-        if link_res != 'NULL' and link_res.isdigit():
-            thread = next((thread for thread in thread_data if thread['Thread'] == ('Thread ' + str(link_res))), None)
-        else:
-            thread = None
+        # Answer locally when the response clearly matches one thread's topic
+        thread = match_thread(response_content, thread_data)
+
+        if thread is None:
+            # Only send the threads most relevant to the response
+            relevant_threads = top_k_records('threads', thread_data, response_content, THREAD_TOP_K)
+
+            # Filter out the 'Link' property from thread data
+            openai_thread_data = [{k: v for k, v in thread.items() if k != 'Link'} for thread in relevant_threads]
+            link_llm_context = {
+                "narrative": response_content,
+                "thread_data": openai_thread_data
+            }
+
+            link_res = generate_response(link_assistant_id, link_llm_context)
+            
+            if link_res and link_res != 'NULL' and link_res.strip().isdigit():
+                thread = threads_by_number.get(link_res.strip())
         
         # Add thread to narrative state
         if thread:
             # Update the narrative_responses in session state
             if 'narrative_responses' in st.session_state:
-                for idx, resp_entry in enumerate(st.session_state.narrative_responses):
-                    if resp_entry.get("id") == narrative["id"]:
-                        st.session_state.narrative_responses[idx]["thread"] = thread
-                        break
+                resp_entry = st.session_state.narrative_responses.get(narrative["id"])
+                if resp_entry:
+                    resp_entry["thread"] = thread
                 st.success("Thread generated successfully!")
             else:
                 st.error("No narrative_responses found in session state.")
@@ -111,6 +211,11 @@ def handle_generate_hashtags(entry):
             return
         
         hashtag_map = load_hashtag_data_from_sheets()
+
+        # Only send the hashtags most relevant to the post and its responses
+        hashtag_query = " ".join([original_content] + [response['content'] for response in responses])
+        hashtag_map = top_k_records('hashtags', hashtag_map or [], hashtag_query, HASHTAG_TOP_K)
+
         hashtag_llm_context = {
             "context": {
                 "original post": original_content, 
@@ -130,10 +235,9 @@ def handle_generate_hashtags(entry):
                 
             # Update the narrative_responses in session state
             if 'narrative_responses' in st.session_state:
-                for idx, resp_entry in enumerate(st.session_state.narrative_responses):
-                    if resp_entry.get("id") == entry["id"]:
-                        st.session_state.narrative_responses[idx]["hashtags"] = hashtags
-                        break
+                resp_entry = st.session_state.narrative_responses.get(entry["id"])
+                if resp_entry:
+                    resp_entry["hashtags"] = hashtags
             else:
                 st.error("No narrative_responses found in session state.")
             
@@ -144,35 +248,8 @@ def handle_generate_hashtags(entry):
     except Exception as e:
         st.error(f"Failed to generate hashtags: {str(e)}")
 
-def handle_generate_response(narrative: dict, strategy: str, voice: str, language: str):
-    """Handle response generation for a narrative with specific strategy."""
-    assistant_id = RESPONSE_STRATEGIES[strategy]
-    llm_context = {
-        "title": narrative['title'],
-        "narrative": narrative['narrative'],
-        "community": narrative['community'],
-        "content": narrative['content'],
-        "response_language": language
-    }
-    res = generate_response(assistant_id, llm_context)
-
-    if not res:
-        st.error("Failed to generate a response.")
-        return
-
-    if voice != "Default":
-        voice_assistant_id = VOICES[voice]
-        llm_context = narrative['content'] + "Respond using the following language: " + language
-        res = generate_response(voice_assistant_id, res)
-
-    # Create response object with strategy metadata
-    response_obj = {
-        "content": res,
-        "strategy": strategy,
-        "voice": voice,
-        "timestamp": datetime.datetime.now().isoformat()
-    }
-    
+def store_narrative_response(narrative: dict, response_obj: Response):
+    """Add a generated response to the narrative's entry in session state."""
     # Create response entry with all narrative data
     response_entry: NarrativeResponse = {
         "id": narrative["hash"],  # Standardizing 'id' to be the same as 'hash'
@@ -190,46 +267,85 @@ def handle_generate_response(narrative: dict, strategy: str, voice: str, languag
     }
 
     # Initialize responses in session state if not exists
-    if 'narrative_responses' not in st.session_state:
-        st.session_state.narrative_responses = []
+    narrative_responses = load_narrative_responses()
     
     # Check if entry with this ID exists
-    existing_entry = next((item for item in st.session_state.narrative_responses 
-                          if item.get("id") == response_entry["id"]), None)
+    existing_entry = narrative_responses.get(response_entry["id"])
     if existing_entry:
         # Append new response to existing entry
-        existing_entry["responses"].append(response_obj)
-        existing_entry["hashtags"] = response_entry["hashtags"]  # Update hashtags
-        existing_entry["thread"] = response_entry["thread"]      # Update thread
+        existing_entry["responses"].append(ResponseRecord.from_dict(response_obj))
+        # Keep hashtags and threads already generated unless the narrative brings its own
+        if "hashtags" in narrative:
+            existing_entry["hashtags"] = response_entry["hashtags"]
+        if "thread" in narrative:
+            existing_entry["thread"] = response_entry["thread"]
     else:
         # Add new entry
-        st.session_state.narrative_responses.append(response_entry)
-    
+        narrative_responses.add(response_entry)
+
+def handle_generate_response(narrative: dict, strategy: str, voice: str, language: str):
+    """Handle response generation for a narrative with specific strategy.
+
+    The response is rendered token by token as it streams in, then stored
+    unless the stream failed.
+    """
+    try:
+        content = st.write_stream(stream_response_variant(narrative, strategy, voice, language))
+    except Exception as e:
+        st.error(f"Failed to generate a response: {e}")
+        return False
+
+    if not content:
+        st.error("Failed to generate a response.")
+        return False
+
+    store_narrative_response(narrative, build_response_obj(content, strategy, voice, language))
     st.success("Response generated successfully! Check the Responses tab.")
+    return True
+
+def handle_generate_response_variants(narrative: dict, strategies: list, voices: list, languages: list):
+    """Generate every strategy/voice/language combination concurrently, storing each as it finishes."""
+    total = len(strategies) * len(voices) * len(languages)
+    if not total:
+        st.warning("Select at least one strategy, voice and language.")
+        return
+
+    progress = st.progress(0.0, text=f"Generating {total} responses...")
+    started = time.perf_counter()
+    call_time = 0.0
+    completed = 0
+    failed = []
+    for strategy, voice, language, response_obj, seconds in generate_response_variants(narrative, strategies, voices, languages):
+        completed += 1
+        call_time += seconds
+        if response_obj:
+            store_narrative_response(narrative, response_obj)
+        else:
+            failed.append(f"{strategy} / {voice} / {language}")
+        progress.progress(completed / total, text=f"Generated {completed} of {total} responses...")
+    wall_time = time.perf_counter() - started
+    progress.empty()
+
+    st.success(
+        f"Generated {total - len(failed)} of {total} responses in {wall_time:.1f}s "
+        f"(sum of individual generation times: {call_time:.1f}s). Check the Responses tab."
+    )
+    if failed:
+        st.error("Failed to generate: " + ", ".join(failed))
 
 def handle_delete(narrative):
     """Handle deleting a narrative."""
-    st.session_state.narrative_results = [
-        n for n in st.session_state.narrative_results if n["hash"] != narrative["hash"]
-    ]
+    load_narrative_results().remove(narrative["hash"])
 
 def load_narrative_responses():
     """Load responses from session state."""
     if 'narrative_responses' not in st.session_state:
-        st.session_state.narrative_responses = []
+        st.session_state.narrative_responses = create_narrative_responses_store()
     return st.session_state.narrative_responses
 
 def save_response_to_sheets(response_data, idx):
     """Save response data to Google Sheets archive."""
     try:
-        # Get fresh connection to sheets
-        sheets = get_sheets()
-        if not sheets:
-            st.error("Could not access worksheets")
-            return False
-            
-        responses_sheet = sheets['responses']
-        
         # Prepare the row data, ensuring all fields are included
         hashtags = response_data.get("hashtags", [])
 
@@ -260,7 +376,8 @@ def save_response_to_sheets(response_data, idx):
         ]
         
 
-        responses_sheet.append_row(row_data)
+        # Stored locally or queued for the background Sheets writer, depending on the backend
+        get_storage().append_rows('responses', [row_data])
         return True
     except Exception as e:
         st.error(f"Failed to save to archive: {str(e)}")
@@ -269,12 +386,9 @@ def save_response_to_sheets(response_data, idx):
 def load_thread_data_from_sheets():
     """Load data from Google Sheets archive."""
     try:
-        sheets = get_sheets()
-        if not sheets:
+        thread_records = get_storage().get_records('threads')
+        if thread_records is None:
             st.error("Could not access worksheets")
-            return None
-        thread_sheet = sheets['threads']      
-        thread_records = thread_sheet.get_all_records()
         return thread_records
     except Exception as e:
         st.error(f"Failed to load from archive: {str(e)}")
@@ -283,53 +397,46 @@ def load_thread_data_from_sheets():
 def load_hashtag_data_from_sheets():
     """Load data from Google Sheets archive."""         
     try:
-        sheets = get_sheets()
-        if not sheets:
+        hashtag_records = get_storage().get_records('hashtags')
+        if hashtag_records is None:
             st.error("Could not access worksheets")
-            return None
-        hashtag_sheet = sheets['hashtags']
-        hashtag_records = hashtag_sheet.get_all_records()
         return hashtag_records
     except Exception as e:
         st.error(f"Failed to load from archive: {str(e)}")
         return None
 
-def save_narrative_artefact_to_sheets(narrative_data):
-    """Save narrative data to Google Sheets archive."""
+def narrative_to_row(narrative_data):
+    """Build the Narrative Results worksheet row for a narrative."""
+    return [
+        narrative_data.get("hash", ""),
+        narrative_data.get("title", ""),
+        narrative_data.get("narrative", ""),
+        narrative_data.get("community", ""),
+        narrative_data.get("link", ""),
+        narrative_data.get("content", ""),    
+        narrative_data.get("hashtags", ""),
+        datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Timestam     
+    ]
+
+def save_narrative_artefacts_to_sheets(narratives):
+    """Save many narratives to the Google Sheets archive in a single append."""
     try:
-        # Get fresh connection to sheets
-        sheets = get_sheets()
-        if not sheets:
-            st.error("Could not access worksheets")
-            return False
-            
-        narrative_sheet = sheets['narrative']
-        
-        # Prepare the row data
-        row_data = [
-            narrative_data.get("hash", ""),
-            narrative_data.get("title", ""),
-            narrative_data.get("narrative", ""),
-            narrative_data.get("community", ""),
-            narrative_data.get("link", ""),
-            narrative_data.get("content", ""),    
-            narrative_data.get("hashtags", ""),
-            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Timestam     
-        ]
-        
-        # Append the row
-        narrative_sheet.append_row(row_data)
-        
+        rows = [narrative_to_row(narrative_data) for narrative_data in narratives]
+        if not rows:
+            return []
+
+        # Written as one append, whichever storage backend is configured
+        get_storage().append_rows('narrative', rows)
+
         # Mark as archived in session state
         if 'archived_narratives' not in st.session_state:
             st.session_state.archived_narratives = set()
-        st.session_state.archived_narratives.add(narrative_data.get("hash"))
-        
-        # Get the updated narrative data from sheets to ensure we have latest version
-        updated_narrative = narrative_sheet.find(narrative_data["hash"])
-        if updated_narrative:
-            row = narrative_sheet.row_values(updated_narrative.row)
-            return {
+
+        # The appended rows are exactly what was sent, so there is no need to read them back
+        saved = []
+        for row in rows:
+            st.session_state.archived_narratives.add(row[0])
+            saved.append({
                 "hash": row[0],
                 "title": row[1], 
                 "narrative": row[2],
@@ -337,12 +444,17 @@ def save_narrative_artefact_to_sheets(narrative_data):
                 "link": row[4],
                 "content": row[5],
                 "hashtags": row[6]
-            }
-        return updated_narrative
+            })
+        return saved
     except Exception as e:
         st.error(f"Failed to save to archive: {str(e)}")
         return False
 
+def save_narrative_artefact_to_sheets(narrative_data):
+    """Save narrative data to Google Sheets archive."""
+    saved = save_narrative_artefacts_to_sheets([narrative_data])
+    return saved[0] if saved else saved
+
 def is_archived(narrative_hash):
     """Check if a narrative has been archived."""
     if 'archived_narratives' not in st.session_state:
@@ -350,13 +462,88 @@ def is_archived(narrative_hash):
     return narrative_hash in st.session_state.archived_narratives
 
 
+PAGE_SIZES = [10, 25, 50, 100]
+SEARCH_SORT_OPTIONS = ["Newest first", "Oldest first", "Community", "Narrative"]
+ARCHIVE_SORT_OPTIONS = ["Newest first", "Oldest first", "Title"]
+
+def paginate(items, key):
+    """Render page controls and return only the items on the current page."""
+    total = len(items)
+    size_col, page_col, info_col = st.columns([0.25, 0.25, 0.5])
+    with size_col:
+        page_size = st.selectbox("Per page", PAGE_SIZES, key=f"{key}_page_size")
+    page_count = max(1, math.ceil(total / page_size))
+    # Clamp a page left over from a larger result set before the widget is drawn
+    if st.session_state.get(f"{key}_page", 1) > page_count:
+        st.session_state[f"{key}_page"] = page_count
+    with page_col:
+        page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    end = min(start + page_size, total)
+    with info_col:
+        st.caption(f"Showing {start + 1 if total else 0}-{end} of {total}")
+    return items[start:end]
+
+def matches_query(item, fields, query):
+    """Case-insensitive substring match of a query against some of an item's fields."""
+    return any(query in str(item.get(field, "")).lower() for field in fields)
+
+def filter_narratives(narratives, query, sort_by):
+    """Filter and sort narratives for the Search tab before anything is rendered."""
+    query = query.strip().lower()
+    if query:
+        narratives = [n for n in narratives if matches_query(n, ("title", "narrative", "community", "content"), query)]
+    if sort_by == "Newest first":
+        return list(reversed(narratives))
+    if sort_by == "Community":
+        return sorted(narratives, key=lambda n: str(n.get("community", "")).lower())
+    if sort_by == "Narrative":
+        return sorted(narratives, key=lambda n: str(n.get("narrative", "")).lower())
+    return list(narratives)
+
+def is_posted(response):
+    return response['Posted'] == True or response['Posted'] == 'TRUE'
+
+def filter_archive(responses, hide_posted, query, sort_by):
+    """Filter and sort archived responses, keeping each one's position in the sheet."""
+    query = query.strip().lower()
+    visible = [
+        (index, response) for index, response in enumerate(responses)
+        if not (hide_posted and is_posted(response))
+        and (not query or matches_query(response, ("Title", "Original Post", "Response", "Strategy", "Hashtags"), query))
+    ]
+    if sort_by == "Newest first":
+        visible.sort(key=lambda item: str(item[1].get('Date', '')), reverse=True)
+    elif sort_by == "Oldest first":
+        visible.sort(key=lambda item: str(item[1].get('Date', '')))
+    elif sort_by == "Title":
+        visible.sort(key=lambda item: str(item[1].get('Title', '')).lower())
+    return visible
+
+# Columns of the Responses worksheet updated from the Archive tab
+POSTED_COLUMN = 10
+METRIC_COLUMNS = {"views": 11, "likes": 12, "retweets": 13, "comments": 14}
+RESPONSE_KEY_COLUMNS = ['ID', 'Date']
+
+def response_row_key(response):
+    """Key identifying an archived response row in the row index."""
+    return tuple(response.get(column) for column in RESPONSE_KEY_COLUMNS)
+
+
 ###################
 ## STREAMLIT UI ##
 ###################
 
 # Initialize Google Sheets connection - only do this once when the app starts
 if 'sheets_initialized' not in st.session_state:
-    st.session_state.sheets_initialized = setup_google_sheets()
+    st.session_state.sheets_initialized = get_storage().setup()
+
+# Serve /metrics for a local Prometheus scrape; a no-op after the first session
+start_metrics_server(METRICS_PORT)
+
+if 'listening_model_restored' not in st.session_state:
+    restore_listening_model()
+    st.session_state.listening_model_restored = True
 
 if "listening_data" not in st.session_state:
     st.session_state.listening_data = load_listening_tags()
@@ -367,8 +554,30 @@ if "days_input" not in st.session_state:
 st.title("Narrative Dashboard")
 st.subheader("Rhizome 2024 | Arkology Studio & Culture Hack Labs")
 
+# Writes queued for Google Sheets in the background report failures here, on the next rerun
+failed_writes = get_failed_writes()
+if failed_writes:
+    st.warning(f"{len(failed_writes)} archive write(s) did not reach Google Sheets.")
+    st.table([
+        {
+            "worksheet": write["worksheet"],
+            "write": write["method"],
+            "failed at": datetime.datetime.fromtimestamp(write["failed_at"]).strftime("%H:%M:%S"),
+            "error": write["error"],
+        }
+        for write in failed_writes
+    ])
+    retry_column, dismiss_column = st.columns(2)
+    with retry_column:
+        if st.button("Retry Failed Writes"):
+            st.info(f"Queued {retry_failed_writes()} write(s) again.")
+    with dismiss_column:
+        if st.button("Dismiss Failed Writes"):
+            dismiss_failed_writes()
+            st.rerun()
+
 
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["Listen", "Search", "Responses", "Archive", "Config"])
+tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["Listen", "Search", "Clusters", "Responses", "Archive", "Config", "Diagnostics"])
 
 # Listening
 with tab1:
@@ -386,6 +595,10 @@ with tab1:
             st.session_state['use_autoprompt'] = True
         if 'livecrawl' not in st.session_state:
             st.session_state['livecrawl'] = None
+        if 'fan_out_search' not in st.session_state:
+            st.session_state['fan_out_search'] = False
+        if 'incremental_search' not in st.session_state:
+            st.session_state['incremental_search'] = True
         
         # Main form inputs
         temp_num_results = st.slider(
@@ -434,6 +647,18 @@ with tab1:
                 index=[None, "always"].index(st.session_state.get('livecrawl', None)),
                 help="None: use cached results, always: fetch fresh results from source"
             )
+
+            temp_fan_out_search = st.checkbox(
+                "Search each phrase separately",
+                value=st.session_state.get('fan_out_search', False),
+                help="Run one search per listening phrase in parallel and merge the results, instead of a single combined search"
+            )
+
+            temp_incremental_search = st.checkbox(
+                "Only fetch content newer than the last search",
+                value=st.session_state.get('incremental_search', True),
+                help="Start each search from the newest publish date seen by the previous search instead of the full day window"
+            )
         
         # Form submit button
         submit_button = st.form_submit_button("Confirm Settings")
@@ -445,9 +670,12 @@ with tab1:
             st.session_state.search_type = temp_search_type
             st.session_state.use_autoprompt = temp_use_autoprompt
             st.session_state.livecrawl = temp_livecrawl
+            st.session_state.fan_out_search = temp_fan_out_search
+            st.session_state.incremental_search = temp_incremental_search
             
             # Save to file
             save_listening_tags(st.session_state.listening_data)
+            save_listening_model(get_listening_model())
             
             st.success("Listening model updated successfully")
 
@@ -458,6 +686,9 @@ with tab2:
     st.write("Search & review retrieved narrative artefacts")
 
 
+    # Pick up narratives classified by the background listener
+    load_stored_narratives()
+
     # Add checkbox for filtering insufficient context
     show_sufficient_context = st.checkbox(
         "Show narratives with sufficient context only",
@@ -466,9 +697,8 @@ with tab2:
     )
 
     if st.button("Find Narratives"):
-        # Initialize results list if it doesn't exist
-        if "narrative_results" not in st.session_state:
-            st.session_state.narrative_results = []
+        # Initialize results store if it doesn't exist
+        narrative_results = load_narrative_results()
         
         progress_container = st.empty()
         with st.spinner('Searching narratives...'):
@@ -479,16 +709,21 @@ with tab2:
             new_narratives_found = False
             
             # Then parse each artefact
-            for narrative in parse_narrative_artefact(search_results):
+            failed_results = []
+            for narrative in parse_narrative_artefact(search_results, failed=failed_results):
                 # Check if this narrative is already in results
-                if not any(item.get("hash") == narrative["hash"] for item in st.session_state.narrative_results):
-                    # Add insufficient_context flag to narrative
-                    narrative["insufficient_context"] = len(narrative.get("content", "").strip()) < 100
-                    st.session_state.narrative_results.append(narrative)
+                if narrative_results.add(narrative):
+                    save_narratives([narrative])
                     new_narratives_found = True
                 
                 # Update progress message
-                progress_container.text(f"Processed {len(st.session_state.narrative_results)} narratives...")
+                progress_container.text(f"Processed {len(narrative_results)} narratives...")
+
+            # Later searches only need content published after this sweep, or
+            # from the oldest artefact that could not be classified
+            commit_listening_watermarks(failed_results)
+            if failed_results:
+                st.warning(f"{len(failed_results)} artefact(s) could not be classified and will be retried on the next search.")
             
             # Clear the progress message when done
             progress_container.empty()
@@ -498,24 +733,41 @@ with tab2:
             else:
                 st.rerun()  # Only rerun if we found new narratives
 
+    if st.session_state.get("search_hit_counts"):
+        with st.expander("Search hits per phrase"):
+            st.table({
+                phrase: {"Results": counts["hits"], "New unique": counts["new"]}
+                for phrase, counts in st.session_state.search_hit_counts.items()
+            })
+
     # Filter results based on insufficient context checkbox
-    filtered_results = []
-    if "narrative_results" in st.session_state:
-        if show_sufficient_context:
-            filtered_results = [n for n in st.session_state.narrative_results if n.get("narrative") != "Insufficient Context"]
-        else:
-            filtered_results = st.session_state.narrative_results
+    if show_sufficient_context:
+        filtered_results = load_narrative_results().view("sufficient_context")
+    else:
+        filtered_results = list(load_narrative_results())
+
+    filter_col, sort_col = st.columns([0.7, 0.3])
+    with filter_col:
+        search_query = st.text_input("Filter narratives", placeholder="Search title, narrative, community or content")
+    with sort_col:
+        search_sort = st.selectbox("Sort by", SEARCH_SORT_OPTIONS, key="search_sort")
+    filtered_results = filter_narratives(filtered_results, search_query, search_sort)
 
     # Single display section for narratives
     if filtered_results:
-        card_template = load_card_template(SEARCH_CARD_TEMPLATE_FILE)
-        for narrative_idx, narrative in enumerate(filtered_results):
-            card_html = card_template.replace("{{ title }}", narrative['title']) \
-                                    .replace("{{ narrative }}", narrative.get('narrative', 'N/A')) \
-                                    .replace("{{ community }}", narrative.get('community', 'N/A')) \
-                                    .replace("{{ link }}", narrative['link']) \
-                                    .replace("{{ content }}", narrative['content']) 
-            st.markdown(card_html, unsafe_allow_html=True)
+        # Narratives ticked for archiving are saved together in one append
+        selected_for_archive = [
+            narrative for narrative in filtered_results
+            if st.session_state.get(f"select_{narrative['hash']}") and not is_archived(narrative["hash"])
+        ]
+        if st.button(f"Archive Selected ({len(selected_for_archive)})", disabled=not selected_for_archive):
+            if save_narrative_artefacts_to_sheets(selected_for_archive):
+                st.success(f"Saved {len(selected_for_archive)} narratives to archive!")
+                st.rerun()
+
+        # Only the current page of cards and forms is rendered on each rerun
+        for narrative_idx, narrative in enumerate(paginate(filtered_results, "search")):
+            st.markdown(render_narrative_card(narrative), unsafe_allow_html=True)
 
             unique_suffix = f"{narrative_idx}_{narrative['hash']}"
             
@@ -547,8 +799,29 @@ with tab2:
                         )
                     submit_response = st.form_submit_button("Generate Response")
                     if submit_response:
-                        with st.spinner('Generating response...'):
-                            handle_generate_response(narrative, strategy, voice, language)
+                        handle_generate_response(narrative, strategy, voice, language)
+                with st.expander("Generate multiple responses"):
+                    with st.form(key=f"variants_form_{unique_suffix}"):
+                        variant_strategies = st.multiselect(
+                            "Strategies",
+                            options=list(RESPONSE_STRATEGIES.keys()),
+                            default=list(RESPONSE_STRATEGIES.keys()),
+                            key=f"variant_strategies_{unique_suffix}"
+                        )
+                        variant_voices = st.multiselect(
+                            "Voices",
+                            options=list(VOICES.keys()),
+                            default=["Default"],
+                            key=f"variant_voices_{unique_suffix}"
+                        )
+                        variant_languages = st.multiselect(
+                            "Languages",
+                            options=list(LANGUAGES),
+                            default=["English"],
+                            key=f"variant_languages_{unique_suffix}"
+                        )
+                        if st.form_submit_button("Generate All Combinations"):
+                            handle_generate_response_variants(narrative, variant_strategies, variant_voices, variant_languages)
             with right_col:
 
                 if not is_archived(narrative["hash"]):
@@ -556,6 +829,7 @@ with tab2:
                             if save_narrative_artefact_to_sheets(narrative):
                                 st.success("Saved to archive!")
                                 st.rerun()
+                        st.checkbox("Select", key=f"select_{narrative['hash']}")
                 else:
                     st.write("✓ Archived")
 
@@ -563,6 +837,67 @@ with tab2:
         st.write("No narrative artefacts yet. Please refer to the Listen tab to set search criteria first, then use the 'Find Narratives' button to retrieve narrative artefacts.")
 
 with tab3:
+    st.header("Narrative Clusters")
+    st.write("Identified narratives grouped by talking point, so each can be answered once")
+
+    narrative_results = load_narrative_results()
+    clusterer = load_narrative_clusters()
+    current_hashes = {narrative["hash"] for narrative in narrative_results.view("sufficient_context")}
+    clusters = clusterer.largest(current_hashes)
+
+    if not clusters:
+        st.write("No narratives to cluster yet. Use 'Find Narratives' in the Search tab first.")
+    else:
+        now = datetime.datetime.now()
+        cluster_rows = []
+        for cluster in clusters:
+            members = [narrative_results.get(member) for member, _ in cluster.members if member in current_hashes]
+            recent, previous = cluster.trend(now, hashes=current_hashes)
+            cluster_rows.append({
+                "cluster": cluster.id,
+                "narrative": members[0].get("narrative", "N/A"),
+                "narratives": len(members),
+                "posts": sum(1 + len(member.get("duplicates") or []) for member in members),
+                "last 24h": recent,
+                "previous 24h": previous,
+                "key terms": ", ".join(cluster.top_terms()),
+            })
+        st.dataframe(cluster_rows, hide_index=True, use_container_width=True)
+
+        top_clusters = clusters[:5]
+        days = sorted({day for cluster in top_clusters for day in cluster.counts_by_day()})
+        if len(days) > 1:
+            st.subheader("Trend of the largest clusters")
+            counts = {f"Cluster {cluster.id}": cluster.counts_by_day() for cluster in top_clusters}
+            st.line_chart([
+                {"day": day.isoformat(), **{label: by_day.get(day, 0) for label, by_day in counts.items()}}
+                for day in days
+            ], x="day", y=list(counts))
+
+        for cluster in paginate(clusters, "clusters"):
+            members = [narrative_results.get(member) for member, _ in cluster.members if member in current_hashes]
+            # Answer the cluster through its earliest narrative still in the results
+            representative = members[0]
+            with st.expander(f"Cluster {cluster.id} ({len(members)}): {representative.get('narrative', 'N/A')}"):
+                for member in members:
+                    st.markdown(f"- [{member.get('title', 'Untitled')}]({member['link']}) — {member.get('community', 'N/A')}")
+                with st.form(key=f"cluster_response_form_{cluster.id}"):
+                    resp_col1, resp_col2, resp_col3 = st.columns(3)
+                    with resp_col1:
+                        strategy = st.selectbox("Strategy", options=list(RESPONSE_STRATEGIES.keys()), key=f"cluster_strategy_{cluster.id}")
+                    with resp_col2:
+                        voice = st.selectbox("Voice", options=list(VOICES.keys()), key=f"cluster_voice_{cluster.id}")
+                    with resp_col3:
+                        language = st.selectbox(
+                            "Language",
+                            options=list(LANGUAGES),
+                            index=LANGUAGES.index("English"),
+                            key=f"cluster_language_{cluster.id}"
+                        )
+                    if st.form_submit_button("Generate Cluster Response"):
+                        handle_generate_response(representative, strategy, voice, language)
+
+with tab4:
     st.header("Responses")
 
     
@@ -572,7 +907,7 @@ with tab3:
     else:
         # Add Clear All button
         if st.button("Clear All", type="secondary"):
-            st.session_state.narrative_responses = []
+            st.session_state.narrative_responses.clear()
             st.success("All responses cleared!")
             st.rerun()
             
@@ -589,7 +924,7 @@ with tab3:
                     with st.container():
                         st.markdown("---") 
                         # Editable text area for response content
-                        response_content = st.text_area(f"Response {idx + 1} (Strategy: {response['strategy']})", 
+                        response_content = st.text_area(f"Response {idx + 1} (Strategy: {response['strategy']}, Language: {response.get('language', 'N/A')})", 
                                                          value=response['content'], 
                                                          height=200, 
                                                          key=f"response_edit_{entry['id']}_{idx}")
@@ -597,11 +932,10 @@ with tab3:
                         # Button to update the response content in the session state
                         if st.button("Update Response", key=f"update_{entry['id']}_{idx}"):
                             if 'narrative_responses' in st.session_state:
-                                for i, resp_entry in enumerate(st.session_state.narrative_responses):
-                                    if resp_entry.get("id") == entry["id"]:
-                                        st.session_state.narrative_responses[i]["responses"][idx]["content"] = response_content
-                                        st.rerun()
-                                        break
+                                resp_entry = st.session_state.narrative_responses.get(entry["id"])
+                                if resp_entry:
+                                    resp_entry["responses"][idx]["content"] = response_content
+                                    st.rerun()
                                 st.success("Response content updated!")
 
                             else:
@@ -609,6 +943,22 @@ with tab3:
                             
 
                        
+                        # Stream a fresh take on this response with the same settings
+                        if st.button("Regenerate", key=f"regenerate_{entry['id']}_{idx}"):
+                            narrative = dict(
+                                entry['original_post'],
+                                hash=entry['id'],
+                                hashtags=entry.get('hashtags', []),
+                                thread=entry.get('thread', ""),
+                            )
+                            if handle_generate_response(
+                                narrative,
+                                response['strategy'],
+                                response.get('voice', 'Default'),
+                                response.get('language', 'English')
+                            ):
+                                st.rerun()
+
                         # Display suggested hashtags
 
                         st.markdown('**Suggested Hashtags**')
@@ -641,7 +991,7 @@ with tab3:
                                 save_response_to_sheets(entry, idx)  # Save to sheets
                                 st.success("Response saved to archive!")
 # Archive:
-with tab4: 
+with tab5: 
     st.header("Archive")
     st.write("View the archived responses in the Google Sheet:")
     
@@ -652,28 +1002,55 @@ with tab4:
 
     
     
+    if st.button("Refresh Archive"):
+        # Threads and hashtags are maintained in the sheet too
+        for name in ('responses', 'threads', 'hashtags'):
+            get_storage().refresh(name)
+
     try:
-        # Get fresh connection to sheets
-        sheets = get_sheets()
-        if not sheets:
+        # Define expected headers
+        expected_headers = ['Title', 'Original Post', 'Response', 'Strategy', 'Link', 'Date', 'Hashtags', 'Thread']
+        # Served from the local database, or a snapshot of the sheet refreshed after SHEETS_CACHE_TTL
+        responses = get_storage().get_records('responses', expected_headers=expected_headers)
+        if responses is None:
             st.error("Could not access worksheets")
         else:
-            responses_sheet = sheets['responses']
-            
-            # Define expected headers
-            expected_headers = ['Title', 'Original Post', 'Response', 'Strategy', 'Link', 'Date', 'Hashtags', 'Thread']
-            responses = responses_sheet.get_all_records(expected_headers=expected_headers)
-            
             if not responses:
                 st.write("No archived responses found.")
             else:
-                # Get count of archived responses
+                # Resolve worksheet rows once per load instead of scanning for each update
+                row_index = build_row_index(responses, RESPONSE_KEY_COLUMNS)
+
+                unposted_titles = {
+                    response_row_key(response): response.get('Title', 'Untitled')
+                    for response in responses
+                    if not is_posted(response)
+                }
+                if unposted_titles:
+                    with st.form(key="bulk_mark_posted"):
+                        selected = st.multiselect(
+                            "Mark several responses as posted",
+                            options=list(unposted_titles),
+                            format_func=lambda key: f"{key[1]} | {unposted_titles[key]}"
+                        )
+                        if st.form_submit_button("Mark Selected as Posted") and selected:
+                            get_storage().update_rows('responses', {row_index[key]: {POSTED_COLUMN: True} for key in selected})
+                            st.success(f"Marked {len(selected)} responses as posted!")
+                            st.rerun()
           
-                for index, response in enumerate(responses):  # Use enumerate to get the index
-                    # Filter responses based on the posted checkbox
-                    posted = response['Posted'] == True or response['Posted'] == 'TRUE'
-                    if filter_posted and posted:
-                        continue  # Skip posted responses if the checkbox is checked
+                filter_col, sort_col = st.columns([0.7, 0.3])
+                with filter_col:
+                    archive_query = st.text_input("Filter archive", placeholder="Search title, post, response, strategy or hashtags")
+                with sort_col:
+                    archive_sort = st.selectbox("Sort by", ARCHIVE_SORT_OPTIONS, key="archive_sort")
+
+                # Filter on the posted checkbox and query before rendering, then show one page
+                visible_responses = filter_archive(responses, filter_posted, archive_query, archive_sort)
+                if not visible_responses:
+                    st.write("No archived responses match the current filters.")
+
+                for index, response in paginate(visible_responses, "archive"):  # index is the response's position in the sheet
+                    posted = is_posted(response)
                     
                     with st.expander(f"🗂️ {response.get('Title', 'Untitled')}", expanded=False):
                         st.markdown("**Original Post:**")
@@ -732,22 +1109,26 @@ with tab4:
                                     comments = st.number_input("Comments", min_value=0, value=0)
                                 submitted = st.form_submit_button("Submit Metrics")
                                 if submitted:
-                                    # Update metrics columns (adjusted indices)
-                                    responses_sheet.update_cell(responses.index(response) + 2, 11, views)  # Views
-                                    responses_sheet.update_cell(responses.index(response) + 2, 12, likes)  # Likes
-                                    responses_sheet.update_cell(responses.index(response) + 2, 13, retweets)  # Retweets
-                                    responses_sheet.update_cell(responses.index(response) + 2, 14, comments)  # Comments
+                                    # Update all metrics columns of the row in one batch
+                                    get_storage().update_rows('responses', {
+                                        row_index[response_row_key(response)]: {
+                                            METRIC_COLUMNS["views"]: views,
+                                            METRIC_COLUMNS["likes"]: likes,
+                                            METRIC_COLUMNS["retweets"]: retweets,
+                                            METRIC_COLUMNS["comments"]: comments,
+                                        }
+                                    })
                                     st.success("Metrics updated!")
                         if st.button("Mark as Posted", key=f"mark_posted_{response.get('Date')}_{index}", disabled=posted):
-                            # Update the Posted? column (column 14)
-                            responses_sheet.update_cell(responses.index(response) + 2, 10, True)
+                            # Update the Posted? column
+                            get_storage().update_rows('responses', {row_index[response_row_key(response)]: {POSTED_COLUMN: True}})
                             st.success("Marked as posted!")
                             st.rerun()
                             
     except Exception as e:
         st.error(f"Error loading archived responses: {str(e)}")
 # Add new Config tab at the end
-with tab5:
+with tab6:
     st.header("Configuration")
     
     st.write("Set your own Exa API key here")
@@ -772,3 +1153,80 @@ with tab5:
                 del os.environ["EXA_API_KEY"]
             st.info("Using default API key from secrets.toml")
 
+    st.subheader("Assistant Latency")
+    st.write("Per-call latency of assistant runs, by backend")
+    latency_summary = get_latency_summary()
+    if latency_summary:
+        st.table({
+            backend: {stat: (value if stat == "calls" else f"{value:.2f}s") for stat, value in stats.items()}
+            for backend, stats in latency_summary.items()
+        })
+    else:
+        st.write("No assistant calls recorded yet.")
+
+    st.subheader("API Connections")
+    st.write("Pooled API clients and how many requests reused an open connection")
+    client_stats = get_client_stats()
+    if client_stats:
+        st.table(client_stats)
+    else:
+        st.write("No API clients created yet.")
+
+    st.subheader("Rate Limits")
+    st.write("Requests per second allowed to each service right now, lowered after throttling and recovering with each success")
+    limiter_stats = get_rate_limiter_stats()
+    if limiter_stats:
+        st.table(limiter_stats)
+    else:
+        st.write("No rate-limited calls made yet.")
+
+    st.subheader("Sheets Sync")
+    st.write("Local rows waiting to reach the Google Sheet, and how long the oldest has waited")
+    sync_status = get_storage().sync_status()
+    if sync_status:
+        st.table(sync_status)
+    else:
+        st.write("Google Sheets sync is not enabled.")
+
+with tab7:
+    st.header("Diagnostics")
+    st.write("Timings of each pipeline step since the dashboard started, shared by every session")
+
+    if st.button("Reset Metrics"):
+        reset_metrics()
+
+    span_summary = get_span_summary()
+    if not span_summary:
+        st.write("Nothing timed yet. Find narratives or generate a response first.")
+    else:
+        st.subheader("Latency Breakdown")
+        st.dataframe([
+            {
+                **row,
+                "error_rate": f"{row['error_rate']:.0%}",
+                **{stat: f"{row[stat]:.2f}s" for stat in ("total", "mean", "p50", "p95", "max")},
+            }
+            for row in span_summary
+        ], hide_index=True, use_container_width=True)
+
+        st.subheader("Recent Spans")
+        st.dataframe([
+            {
+                "finished": datetime.datetime.fromtimestamp(recent["finished"]).strftime("%H:%M:%S"),
+                "span": recent["span"],
+                "parent": recent["parent"],
+                "labels": ", ".join(f"{label}={value}" for label, value in recent["labels"].items()),
+                "seconds": round(recent["seconds"], 3),
+                "error": recent["error"],
+                "thread": recent["thread"],
+            }
+            for recent in get_recent_spans(50)
+        ], hide_index=True, use_container_width=True)
+
+    st.subheader("Prometheus Export")
+    metrics_text = prometheus_text()
+    if METRICS_PORT:
+        st.write(f"Scrape http://127.0.0.1:{METRICS_PORT}/metrics, or download a snapshot:")
+    st.download_button("Download metrics", metrics_text, file_name="metrics.prom", mime="text/plain")
+    with st.expander("Show metrics text"):
+        st.code(metrics_text, language="text")
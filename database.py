@@ -1,17 +1,26 @@
+import time
+import queue
+import atexit
+import threading
 import gspread
 import streamlit as st
 from google.oauth2.service_account import Credentials
 from functools import lru_cache
 
+from config import SHEETS_CACHE_TTL, SHEETS_WRITE_COALESCE_DELAY, SHEETS_WRITE_EXIT_TIMEOUT
+from metrics import span
+from ratelimit import call_with_retry, call_priority, RETRY_STATUSES, BACKGROUND
+
 @lru_cache(maxsize=1)
 def get_sheets():
     """Get or create worksheet connections."""
     try:
-        credentials = get_google_credentials()
-        gc = gspread.authorize(credentials)
-        
-        SHEET_ID = st.secrets["google"]["sheet_id"]
-        spreadsheet = gc.open_by_key(SHEET_ID)
+        with span("sheets.open"):
+            credentials = get_google_credentials()
+            gc = gspread.authorize(credentials)
+
+            SHEET_ID = st.secrets["google"]["sheet_id"]
+            spreadsheet = gc.open_by_key(SHEET_ID)
         
         return {
             'narrative': spreadsheet.worksheet('Narrative Results'),
@@ -23,10 +32,249 @@ def get_sheets():
         st.error(f"Failed to setup Google Sheets: {str(e)}")
         return None
 
+def sheets_call(name, method, *args, **kwargs):
+    """Call a worksheet method through the "sheets" rate limiter, timing it as a "sheets" span.
+
+    Appends are only retried when throttled, as a failed append may still have landed.
+    """
+    retry_statuses = {429} if method.startswith("append") else RETRY_STATUSES
+    with span("sheets", worksheet=name, method=method):
+        return call_with_retry(
+            "sheets", getattr(get_sheets()[name], method), *args, retry_statuses=retry_statuses, **kwargs
+        )
+
 def setup_google_sheets():
     """Initialize connection to Google Sheets."""
     return get_sheets() is not None
 
+# Worksheet snapshots shared by every session:
+# name -> {get_all_records options: {"fetched_at", "headers", "records"}}
+_snapshots = {}
+_snapshot_lock = threading.Lock()
+
+def get_worksheet_records(name, ttl=SHEETS_CACHE_TTL, **kwargs):
+    """Return a worksheet's records from the local snapshot, refetching it once expired.
+
+    Keyword arguments are passed to ``get_all_records`` on a refetch, and each
+    combination of them gets its own snapshot.
+    """
+    options = repr(sorted(kwargs.items()))
+    with _snapshot_lock:
+        snapshot = _snapshots.get(name, {}).get(options)
+        if snapshot and time.monotonic() - snapshot["fetched_at"] < ttl:
+            return list(snapshot["records"])
+
+    sheets = get_sheets()
+    if not sheets:
+        return None
+    records = sheets_call(name, 'get_all_records', **kwargs)
+    with _snapshot_lock:
+        _snapshots.setdefault(name, {})[options] = {
+            "fetched_at": time.monotonic(),
+            "headers": list(records[0].keys()) if records else None,
+            "records": records,
+        }
+    return list(records)
+
+def invalidate_worksheet(name=None):
+    """Drop the snapshot of one worksheet, or of all worksheets, forcing a refetch."""
+    with _snapshot_lock:
+        if name is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(name, None)
+
+def _patch_snapshot(name, method, args):
+    """Apply a queued write to the local snapshots so reads see it before it lands."""
+    with _snapshot_lock:
+        if method not in ("append_row", "append_rows", "update_cell", "update_rows"):
+            _snapshots.pop(name, None)
+            return
+        for snapshot in _snapshots.get(name, {}).values():
+            if not snapshot["headers"]:
+                continue
+            headers = snapshot["headers"]
+            records = snapshot["records"]
+            if method in ("append_row", "append_rows"):
+                rows = [args[0]] if method == "append_row" else args[0]
+                for values in rows:
+                    values = list(values) + [""] * (len(headers) - len(values))
+                    records.append(dict(zip(headers, values)))
+            elif method == "update_cell":
+                row, col, value = args
+                if 2 <= row < len(records) + 2 and 1 <= col <= len(headers):
+                    records[row - 2][headers[col - 1]] = value
+            else:
+                for row, values in args[0].items():
+                    for col, value in values.items():
+                        if 2 <= row < len(records) + 2 and 1 <= col <= len(headers):
+                            records[row - 2][headers[col - 1]] = value
+
+_write_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer_thread = None
+# Writes Google Sheets rejected, kept for the dashboard to report and retry
+_failed_writes = []
+_failed_lock = threading.Lock()
+
+def _start_writer():
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_write_worker, name="sheets-writer", daemon=True)
+            _writer_thread.start()
+
+def queue_write(name, method, *args, **kwargs):
+    """Queue a worksheet write to be applied by the background writer.
+
+    ``append_row``/``append_rows`` calls queued close together are coalesced into a single
+    ``append_rows`` request, and ``update_cell``/``update_rows`` calls into a
+    single ``batch_update``.
+    """
+    _patch_snapshot(name, method, args)
+    _write_queue.put((name, method, args, kwargs))
+    _start_writer()
+
+def get_failed_writes():
+    """Queued writes Google Sheets rejected, oldest first."""
+    with _failed_lock:
+        return list(_failed_writes)
+
+def retry_failed_writes():
+    """Queue every failed write again; returns how many were queued."""
+    with _failed_lock:
+        failed = list(_failed_writes)
+        _failed_writes.clear()
+    for write in failed:
+        _write_queue.put(write["write"])
+    if failed:
+        _start_writer()
+    return len(failed)
+
+def dismiss_failed_writes():
+    """Forget the failed writes without retrying them."""
+    with _failed_lock:
+        _failed_writes.clear()
+
+def build_row_index(records, key_columns):
+    """Map each record's key columns to its worksheet row number (row 1 holds the headers)."""
+    row_index = {}
+    for position, record in enumerate(records):
+        key = tuple(record.get(column) for column in key_columns)
+        row_index.setdefault(key, position + 2)
+    return row_index
+
+def queue_row_updates(name, updates):
+    """Queue cell updates for one or many rows, given as ``{row: {col: value}}``.
+
+    All changed cells are written in a single ``batch_update``.
+    """
+    queue_write(name, 'update_rows', updates)
+
+def build_batch_update(cells):
+    """Turn ``{(row, col): value}`` into ``batch_update`` ranges of adjacent cells."""
+    data = []
+    for row, col in sorted(cells):
+        value = cells[(row, col)]
+        previous = data[-1] if data else None
+        if previous and previous["row"] == row and previous["end_col"] == col - 1:
+            previous["values"].append(value)
+            previous["end_col"] = col
+        else:
+            data.append({"row": row, "start_col": col, "end_col": col, "values": [value]})
+    return [
+        {
+            "range": gspread.utils.rowcol_to_a1(block["row"], block["start_col"]) + ":" +
+                     gspread.utils.rowcol_to_a1(block["row"], block["end_col"]),
+            "values": [block["values"]],
+        }
+        for block in data
+    ]
+
+def flush_writes(timeout=None):
+    """Block until every queued write has been applied; returns False on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _write_queue.all_tasks_done:
+        while _write_queue.unfinished_tasks:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            _write_queue.all_tasks_done.wait(remaining)
+    return True
+
+@atexit.register
+def _flush_at_exit():
+    # The writer is a daemon thread, so anything still queued would be lost on exit
+    if not flush_writes(SHEETS_WRITE_EXIT_TIMEOUT):
+        print(f"Exiting with {_write_queue.unfinished_tasks} Google Sheets writes not applied")
+    failed = get_failed_writes()
+    if failed:
+        print(f"Exiting with {len(failed)} failed Google Sheets writes: {[write['error'] for write in failed]}")
+
+def _write_worker():
+    while True:
+        batch = [_write_queue.get()]
+        # Give a burst of clicks time to accumulate so it goes out as one request
+        time.sleep(SHEETS_WRITE_COALESCE_DELAY)
+        while True:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with call_priority(BACKGROUND):
+                _apply_writes(batch)
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+def _apply_writes(batch):
+    operations = {}
+    for name, method, args, kwargs in batch:
+        operations.setdefault(name, []).append((method, args, kwargs))
+
+    for name, ops in operations.items():
+        rows = []
+        updates = {}
+        for method, args, kwargs in ops:
+            if method == "append_row" and not kwargs:
+                rows.append(args[0])
+            elif method == "append_rows" and not kwargs:
+                rows.extend(args[0])
+            elif method == "update_cell" and not kwargs:
+                row, col, value = args
+                updates.setdefault(row, {})[col] = value
+            elif method == "update_rows":
+                for row, values in args[0].items():
+                    updates.setdefault(row, {}).update(values)
+            else:
+                _apply_write(name, method, args, kwargs)
+        if rows:
+            _apply_write(name, 'append_rows', (rows,), {})
+        if updates:
+            _apply_write(name, 'update_rows', (updates,), {})
+
+def _apply_write(name, method, args, kwargs):
+    """Send one coalesced write, keeping it for a retry if Sheets rejects it."""
+    try:
+        if method == "update_rows":
+            cells = {(row, col): value for row, values in args[0].items() for col, value in values.items()}
+            sheets_call(name, 'batch_update', build_batch_update(cells), value_input_option="USER_ENTERED")
+        else:
+            sheets_call(name, method, *args, **kwargs)
+    except Exception as e:
+        print(f"Failed to write to worksheet '{name}': {e}")
+        with _failed_lock:
+            _failed_writes.append({
+                "worksheet": name,
+                "method": method,
+                "error": str(e),
+                "failed_at": time.time(),
+                "write": (name, method, args, kwargs),
+            })
+        # Local snapshot may now disagree with the sheet
+        invalidate_worksheet(name)
+
 # Setup Google Sheets
 def get_google_credentials():
     """Create service account credentials from secrets."""
@@ -0,0 +1,93 @@
+import random
+import hashlib
+
+from config import NEAR_DUPLICATE_THRESHOLD, MINHASH_PERMUTATIONS, MINHASH_BANDS, SHINGLE_SIZE
+from retrieval import tokenize
+
+# Mersenne prime used for the universal hash family behind the MinHash permutations
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Hashes of the overlapping word n-grams of a text."""
+    tokens = tokenize(text or "")
+    if len(tokens) < size:
+        tokens = tokens or [""]
+        grams = [" ".join(tokens)]
+    else:
+        grams = [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    return {int.from_bytes(hashlib.md5(gram.encode()).digest()[:4], "big") for gram in grams}
+
+
+class MinHashLSH:
+    """MinHash signatures with locality-sensitive banding for near-duplicate lookups.
+
+    Texts whose estimated Jaccard similarity of word shingles reaches
+    ``threshold`` are treated as copies of each other. Banding keeps lookups
+    roughly constant-time: only texts sharing at least one band are compared.
+    """
+
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD, permutations=MINHASH_PERMUTATIONS, bands=MINHASH_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        generator = random.Random(1)  # Fixed seed so signatures are comparable across runs
+        self.coefficients = [
+            (generator.randrange(1, _PRIME), generator.randrange(0, _PRIME))
+            for _ in range(self.rows * bands)
+        ]
+        self.signatures = {}
+        self.buckets = {}
+
+    def signature(self, text):
+        values = shingles(text)
+        return tuple(
+            min(((a * value + b) % _PRIME) & _MAX_HASH for value in values)
+            for a, b in self.coefficients
+        )
+
+    def band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(first, second):
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+    def query(self, text):
+        """Return the key of the most similar indexed text at or above the threshold, or None."""
+        signature = self.signature(text)
+        candidates = set()
+        for band_key in self.band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = self.similarity(signature, self.signatures[key])
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+    def add(self, key, text):
+        signature = self.signature(text)
+        self.signatures[key] = signature
+        for band_key in self.band_keys(signature):
+            self.buckets.setdefault(band_key, []).append(key)
+
+
+def cluster_near_duplicates(items, text=lambda item: item):
+    """Group near-duplicate items, keeping their order of first appearance.
+
+    Returns a list of clusters, each a list of items whose first item is the
+    one every other member was matched against.
+    """
+    index = MinHashLSH()
+    clusters = []
+    for item in items:
+        match = index.query(text(item))
+        if match is None:
+            index.add(len(clusters), text(item))
+            clusters.append([item])
+        else:
+            clusters[match].append(item)
+    return clusters
@@ -1,127 +1,428 @@
 import json
 import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from exa_py import Exa
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from openai import OpenAI
 import streamlit as st
 
+from cache import get_cached_classification, store_classification
 from clients import get_exa_client, get_openai_client
+from dedup import cluster_near_duplicates
+from config import (
+    IDENTIFICATION_MAX_WORKERS,
+    IDENTIFICATION_BATCH_SIZE,
+    IDENTIFICATION_BATCH_TOKEN_BUDGET,
+    SEARCH_MAX_WORKERS,
+)
+from llm import get_llm_backend
+from local_store import get_watermark, save_watermarks
+from metrics import span, traced
+from ratelimit import call_with_retry, INTERACTIVE, BACKGROUND
 
+@traced("identify")
 def invoke_identification_assistant(context):
     """Call the OpenAI API for each content context individually."""
     try:
-        client = get_openai_client()  # Get client when needed
-        thread = client.beta.threads.create()
-        client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=json.dumps(context)
-        )
-
         assistant_id = st.secrets["openai"]["narrative_identification_assistant_id"] 
-
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=assistant_id,
-        )
-        
-        if run.status == 'completed':
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            return parse_assistant_data(messages)
-        else:
-            raise RuntimeError(f"An error occurred: {run.status}. {run.last_error}")
+        content = get_llm_backend().run(assistant_id, context, priority=BACKGROUND)
+        return parse_assistant_data(content)
             
     except Exception as e:
         print(f"Error in invoke_identification_assistant: {str(e)}")
         raise RuntimeError(f"An error occurred: {e}")
 
-def parse_assistant_data(messages):
-    """Parse assistant messages and return JSON-formatted content."""
-    for message in messages.data:
-        if message.role == "assistant":
-            try:
-                return json.loads(message.content[0].text.value)
-            except (json.JSONDecodeError, IndexError):
-                print("Error parsing assistant message content.")
-    return {}
+def parse_assistant_data(content):
+    """Parse the assistant reply and return JSON-formatted content.
+
+    A single classification is returned as a dict. Batched replies, either a
+    JSON array or an object with a ``results`` array, are returned as a list
+    of dicts.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        # Chat completions may wrap JSON in a markdown code fence
+        content = content.strip("`")
+        if content.startswith("json"):
+            content = content[len("json"):]
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        print("Error parsing assistant message content.")
+        return {}
+
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        data = data["results"]
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+    return data
+
+BATCH_INSTRUCTIONS = (
+    "Classify each artefact independently. Respond with a JSON array containing one "
+    "result object per artefact, in the same format you use for a single artefact, "
+    "and copy each artefact's id into an \"id\" field of its result."
+)
+
+def estimate_tokens(llm_context):
+    """Roughly estimate the prompt tokens of a context (about four characters per token)."""
+    return len(json.dumps(llm_context)) // 4 + 1
+
+def pack_batches(items, batch_size=IDENTIFICATION_BATCH_SIZE, token_budget=IDENTIFICATION_BATCH_TOKEN_BUDGET):
+    """Group (content_hash, result, llm_context) items into batches within size and token limits."""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(item[2])
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > token_budget):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+@traced("identify.batch")
+def invoke_identification_batch(batch):
+    """Classify a batch of artefacts in a single assistant call.
+
+    Returns a dict mapping content hash to parsed result. Artefacts whose
+    result is missing or malformed are left out so they can be re-submitted.
+    """
+    batch_context = {
+        "instructions": BATCH_INSTRUCTIONS,
+        "artefacts": [dict(llm_context, id=content_hash) for content_hash, _, llm_context in batch]
+    }
+    parsed_data = invoke_identification_assistant(batch_context)
+    if isinstance(parsed_data, dict):
+        parsed_data = [parsed_data] if parsed_data else []
+    elif not isinstance(parsed_data, list):
+        # A null, string or number reply classifies nothing; every item is re-submitted
+        parsed_data = []
+
+    hashes = [content_hash for content_hash, _, _ in batch]
+    results = {}
+    for position, item in enumerate(parsed_data):
+        if not isinstance(item, dict):
+            continue
+        content_hash = item.pop("id", None)
+        if content_hash is None and len(parsed_data) == len(hashes):
+            # Fall back to positional matching when the assistant omits ids
+            content_hash = hashes[position]
+        if content_hash in hashes and item:
+            results[content_hash] = item
+    return results
 
 import hashlib
 import streamlit as st
 
-def search_narrative_artefacts(days=7):
-    """Search for narrative artefacts using Exa"""
+def get_content_hash(text):
+    """Hash the opening of an artefact's text to identify duplicate content."""
+    return hashlib.md5(text[:300].encode()).hexdigest()
 
-    try:
-        exa = get_exa_client()
-        
-        # Use session state directly instead of loading from file
-        tags = ", ".join(st.session_state.listening_tags)
-        start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        
-        response = exa.search_and_contents(
-            tags, 
-            num_results=st.session_state.num_results, 
-            type=st.session_state.search_type, 
-            use_autoprompt=st.session_state.use_autoprompt, 
+def get_result_hash(result):
+    """Hash a search result's content, or its URL if it has no text.
+
+    Results without text all share one content hash, so they are told apart
+    by URL instead of being dropped as duplicates of each other.
+    """
+    if (result.text or "").strip():
+        return get_content_hash(result.text)
+    return get_content_hash(f"url:{result.url}")
+
+def get_listening_model():
+    """Read the listening model settings from session state."""
+    return {
+        "listening_tags": list(st.session_state.listening_tags),
+        "num_results": st.session_state.num_results,
+        "search_type": st.session_state.search_type,
+        "use_autoprompt": st.session_state.use_autoprompt,
+        "livecrawl": st.session_state.livecrawl,
+        "fan_out_search": st.session_state.get("fan_out_search", False),
+        "incremental_search": st.session_state.get("incremental_search", True),
+        "days_input": st.session_state.get("days_input", 7),
+    }
+
+def search_phrase(exa, query, start_date, listening_model, priority=INTERACTIVE):
+    """Run a single Exa search for one query string, retrying if Exa throttles it."""
+    with span("exa.search"):
+        response = call_with_retry(
+            "exa",
+            exa.search_and_contents,
+            query, 
+            priority=priority,
+            num_results=listening_model["num_results"], 
+            type=listening_model["search_type"], 
+            use_autoprompt=listening_model["use_autoprompt"], 
             include_domains=["x.com"],
             category="tweet", 
             text=True, 
             highlights=False,
             start_published_date=start_date,
-            livecrawl=st.session_state.livecrawl 
+            livecrawl=listening_model["livecrawl"] 
         )
+    return response.results
+
+def sweep_listening_model(listening_model, days=7, exa=None, priority=INTERACTIVE):
+    """Search Exa for every query of a listening model.
+
+    By default all listening phrases are joined into one query. In fan-out
+    mode each phrase gets its own search, run concurrently under the shared
+    Exa rate limiter. In incremental mode each query starts from its
+    persisted high-water mark, the newest published date seen by an earlier
+    sweep. Searches wait for the Exa rate limiter at ``priority``.
+
+    Returns the merged results, deduplicated by URL and content hash, the
+    per-query hit counts and the high-water marks reached by this sweep.
+    """
+    exa = exa or get_exa_client()
+
+    tags = listening_model["listening_tags"]
+    if listening_model.get("fan_out_search", False):
+        queries = [tag.strip() for tag in tags if tag.strip()]
+    else:
+        queries = [", ".join(tags)]
+    incremental = listening_model.get("incremental_search", True)
+    start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+    # Only fetch content newer than the last successful sweep of each query
+    start_dates = {}
+    for query in queries:
+        watermark = get_watermark(query) if incremental else None
+        start_dates[query] = max(start_date, watermark) if watermark else start_date
+
+    results_by_query = {}
+    if len(queries) == 1:
+        results_by_query[queries[0]] = search_phrase(exa, queries[0], start_dates[queries[0]], listening_model, priority)
+    elif queries:
+        with ThreadPoolExecutor(max_workers=min(SEARCH_MAX_WORKERS, len(queries))) as executor:
+            futures = {executor.submit(search_phrase, exa, query, start_dates[query], listening_model, priority): query for query in queries}
+            for future in as_completed(futures):
+                query = futures[future]
+                try:
+                    results_by_query[query] = future.result()
+                except Exception as e:
+                    print(f"Error searching for phrase '{query}': {e}")
+                    results_by_query[query] = []
+
+    # Remove duplicates from search results based on URL and content
+    seen_urls = set()
+    seen_hashes = set()
+    unique_results = []
+    hit_counts = {}
+    watermarks = {}
+    for query in queries:
+        results = results_by_query.get(query, [])
+        published_dates = [result.published_date for result in results if result.published_date]
+        if published_dates:
+            watermarks[query] = max(published_dates)
+        new_results = 0
+        for result in results:
+            content_hash = get_result_hash(result)
+            if result.url in seen_urls or content_hash in seen_hashes:
+                continue
+            seen_urls.add(result.url)
+            seen_hashes.add(content_hash)
+            unique_results.append(result)
+            new_results += 1
+        hit_counts[query] = {"hits": len(results), "new": new_results}
+
+    return unique_results, hit_counts, watermarks
+
+@traced("search")
+def search_narrative_artefacts(days=7, fan_out=None, incremental=None):
+    """Search for narrative artefacts using Exa
 
-        # Remove duplicates from search results based on URL
-        seen_urls = set()
-        unique_results = []
-        for result in response.results:
-            if result.url not in seen_urls:
-                seen_urls.add(result.url)
-                unique_results.append(result)
-        response.results = unique_results
+    Sweeps the listening model in session state. Per-phrase hit counts are
+    stored in ``st.session_state.search_hit_counts`` and the high-water marks
+    reached are held in ``st.session_state.pending_watermarks`` until
+    ``commit_listening_watermarks`` is called.
+    """
 
-        return response.results
+    try:
+        exa = get_exa_client()
+        
+        # Use session state directly instead of loading from file
+        listening_model = get_listening_model()
+        if fan_out is not None:
+            listening_model["fan_out_search"] = fan_out
+        if incremental is not None:
+            listening_model["incremental_search"] = incremental
+
+        results, hit_counts, watermarks = sweep_listening_model(listening_model, days, exa)
+        st.session_state.search_hit_counts = hit_counts
+        st.session_state.pending_watermarks = watermarks
+
+        return results
     except RuntimeError as e:
         print(f"Error searching for narrative artefacts: {e}")
         return []
-def parse_narrative_artefact(exa_results):
-    """Parse narrative artefacts using the Narrative Identification Assistant."""
+
+def hold_watermarks(watermarks, failed):
+    """Keep high-water marks at the oldest artefact that failed classification.
+
+    The next sweep then fetches the failed artefacts again. Marks are dropped
+    altogether if a failed artefact has no published date.
+    """
+    if not failed:
+        return watermarks
+    published_dates = [result.published_date for result in failed]
+    if not all(published_dates):
+        return {}
+    oldest = min(published_dates)
+    return {query: min(watermark, oldest) for query, watermark in watermarks.items()}
+
+def commit_listening_watermarks(failed=None):
+    """Persist the high-water marks of the last search once its results are processed.
+
+    ``failed`` holds the results whose classification failed; marks stay at or
+    below the oldest of them.
+    """
+    watermarks = hold_watermarks(st.session_state.get("pending_watermarks") or {}, failed)
+    if watermarks:
+        save_watermarks(watermarks)
+    st.session_state.pending_watermarks = {}
+
+def build_narrative(parsed_data, content_hash, result, duplicates=None):
+    """Combine metadata from exa with the LLM response."""
+    parsed_data["hash"] = content_hash  # Add the hash to parsed data
+    parsed_data['link'] = result.url
+    parsed_data['content'] = result.text
+    parsed_data["insufficient_context"] = len((result.text or "").strip()) < 100
+    parsed_data["duplicates"] = list(duplicates or [])  # Links of near-duplicate copies
+    parsed_data["found_at"] = datetime.now().isoformat()
+    return parsed_data
+
+def parse_narrative_artefact(exa_results, max_workers=IDENTIFICATION_MAX_WORKERS, batch_size=IDENTIFICATION_BATCH_SIZE, processed_hashes=None, failed=None):
+    """Parse narrative artefacts using the Narrative Identification Assistant.
+
+    Artefacts already classified by the assistant are served from the on-disk
+    cache. The rest are classified concurrently on a bounded thread pool and
+    each parsed narrative is yielded as soon as its assistant run completes.
+    With ``batch_size`` above one, several artefacts share a single assistant
+    call and only the items that fail to parse are re-submitted on their own.
+    Near-duplicate artefacts (retweets, quotes, lightly edited copies) are
+    clustered first and only the longest of each cluster is classified; the
+    other members' links are kept in the narrative's ``duplicates``.
+
+    Hashes already seen are tracked in ``st.session_state.processed_hashes``
+    unless a ``processed_hashes`` set is passed in. Artefacts whose
+    classification fails are appended to ``failed``, if given, and dropped from
+    the processed hashes so a later sweep retries them.
+    """
     try:
-        if "processed_hashes" not in st.session_state:
-            st.session_state.processed_hashes = set()
+        if processed_hashes is None:
+            if "processed_hashes" not in st.session_state:
+                st.session_state.processed_hashes = set()
+            processed_hashes = st.session_state.processed_hashes
+
+        assistant_id = st.secrets["openai"]["narrative_identification_assistant_id"]
+
+        def mark_failed(content_hash, result):
+            for member in clusters_by_hash.get(content_hash, [result]):
+                processed_hashes.discard(get_result_hash(member))
+            if failed is not None:
+                failed.append(result)
 
+        new_results = []
         for result in exa_results:
             # Generate a unique hash for each content
-            content_hash = hashlib.md5(result.text[:300].encode()).hexdigest()
+            content_hash = get_result_hash(result)
 
             # Skip duplicates across multiple function calls
-            if content_hash in st.session_state.processed_hashes:
+            if content_hash in processed_hashes:
                 continue
-            st.session_state.processed_hashes.add(content_hash)
-            
+            processed_hashes.add(content_hash)
+            new_results.append(result)
+
+        pending = []
+        duplicates = {}
+        clusters_by_hash = {}
+        # Results without text have nothing to compare, so each stays on its own
+        with_text = [result for result in new_results if (result.text or "").strip()]
+        clusters = cluster_near_duplicates(with_text, text=lambda result: result.text)
+        clusters += [[result] for result in new_results if not (result.text or "").strip()]
+        for cluster in clusters:
+            result = max(cluster, key=lambda member: len(member.text or ""))
+            content_hash = get_result_hash(result)
+            duplicates[content_hash] = [member.url for member in cluster if member is not result]
+            clusters_by_hash[content_hash] = cluster
+            if duplicates[content_hash]:
+                print(f"Classifying one representative for {len(cluster)} near-duplicate artefacts")
+
+            cached_data = get_cached_classification(content_hash, assistant_id)
+            if cached_data:
+                yield build_narrative(cached_data, content_hash, result, duplicates[content_hash])
+                continue
+
             llm_context = {
                 "title": result.title,
                 "content": result.text
             }
-            
-            try:
+            pending.append((content_hash, result, llm_context))
+
+        if not pending:
+            return
+
+        workers = max(1, min(max_workers, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+
+            def submit_single(item):
                 print("Calling identification assistant...")
-                parsed_data = invoke_identification_assistant(llm_context)
-                if parsed_data:
-                    # Combine metadata from exa with the LLM response
-                    parsed_data["hash"] = content_hash  # Add the hash to parsed data
-                    parsed_data['link'] = result.url
-                    parsed_data['content'] = result.text
-                    yield parsed_data  # Yield each parsed content individually with its hash
-                else:
-                    print("Warning: identification assistant returned empty result")
-            except RuntimeError as e:
-                print(f"Failed to process content with hash {content_hash}. Error: {str(e)}")
-                print(f"LLM context that caused error: {llm_context}")
+                futures[executor.submit(invoke_identification_assistant, item[2])] = [item]
+
+            if batch_size > 1:
+                for batch in pack_batches(pending, batch_size):
+                    if len(batch) == 1:
+                        submit_single(batch[0])
+                    else:
+                        print(f"Calling identification assistant with a batch of {len(batch)}...")
+                        futures[executor.submit(invoke_identification_batch, batch)] = batch
+            else:
+                for item in pending:
+                    submit_single(item)
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    items = futures.pop(future)
+
+                    if len(items) > 1:
+                        try:
+                            batch_results = future.result()
+                        except RuntimeError as e:
+                            print(f"Batch of {len(items)} failed, re-submitting individually. Error: {str(e)}")
+                            batch_results = {}
+                        for item in items:
+                            content_hash, result, _ = item
+                            parsed_data = batch_results.get(content_hash)
+                            if parsed_data:
+                                store_classification(content_hash, assistant_id, parsed_data)
+                                yield build_narrative(parsed_data, content_hash, result, duplicates[content_hash])
+                            else:
+                                submit_single(item)
+                        continue
+
+                    content_hash, result, llm_context = items[0]
+                    try:
+                        parsed_data = future.result()
+                        if isinstance(parsed_data, list):
+                            parsed_data = parsed_data[0] if parsed_data else {}
+                        if parsed_data and isinstance(parsed_data, dict):
+                            store_classification(content_hash, assistant_id, parsed_data)
+                            yield build_narrative(parsed_data, content_hash, result, duplicates[content_hash])  # Yield each parsed content individually with its hash
+                        else:
+                            print("Warning: identification assistant returned empty result")
+                            mark_failed(content_hash, result)
+                    except RuntimeError as e:
+                        print(f"Failed to process content with hash {content_hash}. Error: {str(e)}")
+                        print(f"LLM context that caused error: {llm_context}")
+                        mark_failed(content_hash, result)
     except RuntimeError as e:
         print(f"Critical error in parse_narrative_artefact: {str(e)}")
         print(f"Full error context: {e.__class__.__name__}: {str(e)}")
         raise RuntimeError(f"Failed to parse narrative artefacts: {str(e)}")
-
-
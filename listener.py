@@ -0,0 +1,63 @@
+import time
+import argparse
+import datetime
+
+from config import LISTENER_INTERVAL, METRICS_PORT
+from listen import sweep_listening_model, parse_narrative_artefact, hold_watermarks
+from local_store import load_listening_model, load_narrative_hashes, save_narratives, save_watermarks
+from metrics import span, start_metrics_server
+from ratelimit import BACKGROUND
+
+
+def run_sweep():
+    """Search and classify the stored listening model once. Returns the number of new narratives."""
+    with span("listener.sweep"):
+        return _run_sweep()
+
+
+def _run_sweep():
+    listening_model = load_listening_model()
+    if not listening_model or not any(tag.strip() for tag in listening_model.get("listening_tags", [])):
+        print("No listening model saved yet. Confirm settings in the dashboard's Listen tab first.")
+        return 0
+
+    results, hit_counts, watermarks = sweep_listening_model(
+        listening_model, days=listening_model.get("days_input", 7), priority=BACKGROUND
+    )
+    print(f"Found {len(results)} artefacts: {hit_counts}")
+
+    narratives_found = 0
+    failed = []
+    for narrative in parse_narrative_artefact(results, processed_hashes=load_narrative_hashes(), failed=failed):
+        # Store each narrative as it completes so the dashboard sees it straight away
+        save_narratives([narrative])
+        narratives_found += 1
+
+    if failed:
+        print(f"{len(failed)} artefacts could not be classified; they are fetched again next sweep")
+    save_watermarks(hold_watermarks(watermarks, failed))
+    return narratives_found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background narrative listener")
+    parser.add_argument("--interval", type=int, default=LISTENER_INTERVAL, help="Seconds between sweeps")
+    parser.add_argument("--once", action="store_true", help="Run a single sweep and exit")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Port serving Prometheus /metrics (0 disables)")
+    args = parser.parse_args()
+    start_metrics_server(args.metrics_port)
+
+    while True:
+        started = time.monotonic()
+        try:
+            narratives_found = run_sweep()
+            print(f"{datetime.datetime.now().isoformat()} sweep stored {narratives_found} new narratives")
+        except Exception as e:
+            print(f"Listener sweep failed: {e}")
+        if args.once:
+            break
+        time.sleep(max(0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
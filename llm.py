@@ -0,0 +1,206 @@
+import json
+import time
+import threading
+from functools import lru_cache
+
+from clients import get_openai_client
+from config import LLM_BACKEND, LLM_BASE_URL, LLM_API_KEY
+from metrics import span, record_span, get_span_summary
+from ratelimit import call_priority, INTERACTIVE
+
+# Spans timing assistant calls, and the suffix naming each one after its backend
+LATENCY_SPANS = {"llm.run": "", "llm.stream": " stream", "llm.first_token": " first token"}
+
+
+def get_latency_summary():
+    """Summarise the latency of assistant calls per backend, from their spans."""
+    summary = {}
+    for row in get_span_summary():
+        if row["span"] not in LATENCY_SPANS:
+            continue
+        backend = row["labels"].replace("backend=", "")
+        summary[backend + LATENCY_SPANS[row["span"]]] = {
+            stat: row[stat] for stat in ("calls", "mean", "p50", "p95", "max")
+        }
+    return summary
+
+
+def parse_assistant_message(messages):
+    """Return the text of the first assistant message in a thread."""
+    for message in messages.data:
+        if message.role == "assistant":
+            try:
+                return message.content[0].text.value
+            except (AttributeError, IndexError):
+                print("Error parsing assistant message content.")
+    return ""
+
+
+# Marks an exhausted stream
+_END = object()
+
+
+class AssistantBackend:
+    """Runs an assistant prompt against a JSON context and returns the reply text.
+
+    Each request a call makes waits for the shared "openai" rate limiter at the
+    call's ``priority``, so interactive replies overtake background classification.
+    """
+
+    name = "base"
+
+    def run(self, assistant_id, context, priority=INTERACTIVE):
+        """Invoke the assistant, timing the call as an "llm.run" span."""
+        with span("llm.run", backend=self.name), call_priority(priority):
+            return self._run(assistant_id, json.dumps(context))
+
+    def stream(self, assistant_id, context, priority=INTERACTIVE):
+        """Invoke the assistant, yielding reply text as it arrives.
+
+        Time to first token is recorded next to the full call latency. Both are
+        recorded as finished spans, as an open span would outlive each ``yield``.
+        """
+        start = time.perf_counter()
+        first_token = False
+        error = False
+        try:
+            chunks = self._stream(assistant_id, json.dumps(context))
+            while True:
+                # Only the backend's own steps run at ``priority``, not the consumer between chunks
+                with call_priority(priority):
+                    text = next(chunks, _END)
+                if text is _END:
+                    break
+                if text and not first_token:
+                    first_token = True
+                    record_span("llm.first_token", time.perf_counter() - start, backend=self.name)
+                yield text
+        except Exception:
+            error = True
+            raise
+        finally:
+            record_span("llm.stream", time.perf_counter() - start, error, backend=self.name)
+
+    def _run(self, assistant_id, content):
+        raise NotImplementedError
+
+    def _stream(self, assistant_id, content):
+        # Backends without native streaming deliver the whole reply at once
+        yield self._run(assistant_id, content)
+
+
+class AssistantsBackend(AssistantBackend):
+    """Thread/run based backend using the OpenAI Assistants API."""
+
+    name = "assistants"
+
+    def _run(self, assistant_id, content):
+        client = get_openai_client()
+        with span("llm.create_thread", backend=self.name):
+            thread = client.beta.threads.create()
+            client.beta.threads.messages.create(
+                thread_id=thread.id,
+                role="user",
+                content=content
+            )
+        with span("llm.poll_run", backend=self.name):
+            run = client.beta.threads.runs.create_and_poll(
+                thread_id=thread.id,
+                assistant_id=assistant_id,
+            )
+
+        if run.status == 'completed':
+            with span("llm.list_messages", backend=self.name):
+                messages = client.beta.threads.messages.list(thread_id=thread.id)
+            return parse_assistant_message(messages)
+        raise RuntimeError(f"An error occurred: {run.status}. {run.last_error}")
+
+    def _stream(self, assistant_id, content):
+        client = get_openai_client()
+        # Creating the thread and run together saves two round trips
+        with client.beta.threads.create_and_run_stream(
+            assistant_id=assistant_id,
+            thread={"messages": [{"role": "user", "content": content}]},
+        ) as stream:
+            for text in stream.text_deltas:
+                yield text
+            run = stream.current_run
+        if run is not None and run.status != 'completed':
+            raise RuntimeError(f"An error occurred: {run.status}. {run.last_error}")
+
+
+class ChatCompletionsBackend(AssistantBackend):
+    """Single-request backend replaying an assistant's stored system prompt.
+
+    Each assistant's model and instructions are fetched once and reused, so a
+    call costs one chat completion. Pointing ``base_url`` at a local
+    OpenAI-compatible server runs the dashboard against a stand-in model.
+    """
+
+    name = "chat"
+
+    def __init__(self, base_url=None, api_key=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.prompts = {}
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        if self.base_url:
+            return get_openai_client(api_key=self.api_key or "local", base_url=self.base_url)
+        return get_openai_client()
+
+    def get_assistant_prompt(self, assistant_id):
+        """Return the stored model and instructions for an assistant.
+
+        Assistants only exist on OpenAI, so they are always fetched from there,
+        even when completions go to a stand-in server at ``base_url``.
+        """
+        with self._lock:
+            prompt = self.prompts.get(assistant_id)
+        if prompt is None:
+            assistant = get_openai_client().beta.assistants.retrieve(assistant_id)
+            prompt = {
+                "model": assistant.model,
+                "instructions": assistant.instructions or "",
+                "temperature": assistant.temperature,
+                "top_p": assistant.top_p,
+            }
+            with self._lock:
+                self.prompts[assistant_id] = prompt
+        return prompt
+
+    def build_params(self, assistant_id, content):
+        prompt = self.get_assistant_prompt(assistant_id)
+        params = {
+            "model": prompt["model"],
+            "messages": [
+                {"role": "system", "content": prompt["instructions"]},
+                {"role": "user", "content": content},
+            ],
+        }
+        if prompt["temperature"] is not None:
+            params["temperature"] = prompt["temperature"]
+        if prompt["top_p"] is not None:
+            params["top_p"] = prompt["top_p"]
+        return params
+
+    def _run(self, assistant_id, content):
+        completion = self.get_client().chat.completions.create(**self.build_params(assistant_id, content))
+        return completion.choices[0].message.content or ""
+
+    def _stream(self, assistant_id, content):
+        chunks = self.get_client().chat.completions.create(stream=True, **self.build_params(assistant_id, content))
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+@lru_cache(maxsize=None)
+def get_llm_backend(name=LLM_BACKEND):
+    """Get the configured assistant backend."""
+    if name == "chat":
+        return ChatCompletionsBackend(base_url=LLM_BASE_URL, api_key=LLM_API_KEY)
+    if name == "assistants":
+        return AssistantsBackend()
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -0,0 +1,142 @@
+import os
+import json
+import sqlite3
+import datetime
+
+from config import LOCAL_STORE_FILE
+
+
+def get_connection(path=LOCAL_STORE_FILE):
+    """Open the local dashboard database, creating its tables if needed."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    # The dashboard and the background listener share this file
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS listening_watermarks (
+            query TEXT PRIMARY KEY,
+            published_date TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS listening_model (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            model TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS narratives (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT NOT NULL UNIQUE,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    return conn
+
+
+def get_watermark(query):
+    """Return the newest published date seen for a listening query, or None."""
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT published_date FROM listening_watermarks WHERE query = ?", (query,)
+        ).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def save_watermarks(watermarks):
+    """Advance the high-water mark of each query, never moving one backwards."""
+    updated_at = datetime.datetime.now().isoformat()
+    conn = get_connection()
+    try:
+        for query, published_date in watermarks.items():
+            conn.execute(
+                """
+                INSERT INTO listening_watermarks (query, published_date, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(query) DO UPDATE SET
+                    published_date = MAX(published_date, excluded.published_date),
+                    updated_at = excluded.updated_at
+                """,
+                (query, published_date, updated_at)
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def save_listening_model(listening_model):
+    """Store the listening model so the background listener can sweep it."""
+    conn = get_connection()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO listening_model (id, model, updated_at) VALUES (1, ?, ?)",
+            (json.dumps(listening_model), datetime.datetime.now().isoformat())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_listening_model():
+    """Return the stored listening model, or None if none has been saved."""
+    conn = get_connection()
+    try:
+        row = conn.execute("SELECT model FROM listening_model WHERE id = 1").fetchone()
+        return json.loads(row[0]) if row else None
+    finally:
+        conn.close()
+
+
+def save_narratives(narratives):
+    """Store classified narratives, ignoring hashes that are already stored."""
+    created_at = datetime.datetime.now().isoformat()
+    conn = get_connection()
+    try:
+        conn.executemany(
+            "INSERT OR IGNORE INTO narratives (hash, data, created_at) VALUES (?, ?, ?)",
+            [(narrative["hash"], json.dumps(narrative), created_at) for narrative in narratives]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_narratives(after_id=0, since=None, limit=None):
+    """Return narratives stored after ``after_id`` and the id of the newest one.
+
+    ``since`` (an ISO timestamp) skips narratives stored before it, and
+    ``limit`` keeps only the newest ones.
+    """
+    conn = get_connection()
+    try:
+        last_id = conn.execute("SELECT MAX(id) FROM narratives").fetchone()[0]
+        rows = conn.execute(
+            "SELECT id, data FROM narratives WHERE id > ? AND created_at >= ? ORDER BY id DESC LIMIT ?",
+            (after_id, since or "", -1 if limit is None else limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    rows.reverse()
+    return [json.loads(data) for _, data in rows], max(last_id or 0, after_id)
+
+
+def load_narrative_hashes():
+    """Return the set of content hashes of every stored narrative."""
+    conn = get_connection()
+    try:
+        return {row[0] for row in conn.execute("SELECT hash FROM narratives")}
+    finally:
+        conn.close()
@@ -0,0 +1,198 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_SAMPLE_SIZE, METRICS_RECENT_SPANS, METRICS_BUCKETS
+
+# Timing statistics per (span name, labels), shared by every session and thread
+_spans = {}
+_spans_lock = threading.Lock()
+# Most recent finished spans, newest last, for the Diagnostics tab
+_recent = deque(maxlen=METRICS_RECENT_SPANS)
+# Stack of open span names per thread, so finished spans know their parent
+_local = threading.local()
+
+
+class SpanStats:
+    """Call count, error count and durations of one span."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(METRICS_BUCKETS)
+        self.samples = deque(maxlen=METRICS_SAMPLE_SIZE)
+
+    def record(self, seconds, error):
+        self.calls += 1
+        self.errors += int(error)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+        for position, bound in enumerate(METRICS_BUCKETS):
+            if seconds <= bound:
+                self.buckets[position] += 1
+
+
+def record_span(name, seconds, error=False, parent=None, **labels):
+    """Record one finished span, e.g. a call timed somewhere without ``span``."""
+    key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+    with _spans_lock:
+        if key not in _spans:
+            _spans[key] = SpanStats()
+        _spans[key].record(seconds, error)
+        _recent.append({
+            "span": name,
+            "labels": dict(key[1]),
+            "parent": parent or "",
+            "finished": time.time(),
+            "seconds": seconds,
+            "error": error,
+            "thread": threading.current_thread().name,
+        })
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block as a span; an exception raised in it counts as an error."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        stack.pop()
+        record_span(name, time.perf_counter() - start, error, parent, **labels)
+
+
+def traced(name, **labels):
+    """Decorator timing every call of a function as a span."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def get_span_summary():
+    """Calls, errors and latency percentiles per span, slowest total first."""
+    with _spans_lock:
+        snapshot = [(name, labels, stats.calls, stats.errors, stats.total, stats.max, sorted(stats.samples))
+                    for (name, labels), stats in _spans.items()]
+    summary = []
+    for name, labels, calls, errors, total, longest, samples in snapshot:
+        summary.append({
+            "span": name,
+            "labels": ", ".join(f"{label}={value}" for label, value in labels),
+            "calls": calls,
+            "errors": errors,
+            "error_rate": errors / calls if calls else 0.0,
+            "total": total,
+            "mean": total / calls if calls else 0.0,
+            "p50": percentile(samples, 0.5) if samples else 0.0,
+            "p95": percentile(samples, 0.95) if samples else 0.0,
+            "max": longest,
+        })
+    return sorted(summary, key=lambda row: row["total"], reverse=True)
+
+
+def get_recent_spans(limit=None):
+    """The most recently finished spans, newest first."""
+    with _spans_lock:
+        recent = list(_recent)
+    recent.reverse()
+    return recent[:limit] if limit else recent
+
+
+def reset_metrics():
+    with _spans_lock:
+        _spans.clear()
+        _recent.clear()
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (label, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for label, value in pairs
+    )
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+
+def prometheus_text():
+    """All span metrics in the Prometheus text exposition format."""
+    with _spans_lock:
+        snapshot = [(name, labels, stats.calls, stats.errors, stats.total, list(stats.buckets))
+                    for (name, labels), stats in sorted(_spans.items())]
+    lines = [
+        "# HELP dashboard_span_duration_seconds Duration of instrumented pipeline steps.",
+        "# TYPE dashboard_span_duration_seconds histogram",
+    ]
+    for name, labels, calls, _, total, buckets in snapshot:
+        labels = (("span", name),) + labels
+        for bound, count in zip(METRICS_BUCKETS, buckets):
+            lines.append(f"dashboard_span_duration_seconds_bucket{_label_text(labels, [('le', str(bound))])} {count}")
+        lines.append(f"dashboard_span_duration_seconds_bucket{_label_text(labels, [('le', '+Inf')])} {calls}")
+        lines.append(f"dashboard_span_duration_seconds_sum{_label_text(labels)} {total}")
+        lines.append(f"dashboard_span_duration_seconds_count{_label_text(labels)} {calls}")
+    lines += [
+        "# HELP dashboard_span_errors_total Instrumented pipeline steps that raised an error.",
+        "# TYPE dashboard_span_errors_total counter",
+    ]
+    for name, labels, _, errors, _, _ in snapshot:
+        lines.append(f"dashboard_span_errors_total{_label_text((('span', name),) + labels)} {errors}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve ``/metrics`` for a local Prometheus scrape, once per process."""
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"Failed to start metrics server on port {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
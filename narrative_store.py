@@ -0,0 +1,82 @@
+from typed_dicts import NarrativeRecord, NarrativeResponseRecord
+
+
+class NarrativeStore:
+    """Insertion-ordered records indexed by a key field, with filtered views.
+
+    Lookups, inserts and removals by key are O(1). Each view is a predicate
+    whose matching keys are kept up to date as records are added or removed,
+    so reading a filtered view never rescans the whole store.
+    """
+
+    def __init__(self, key, record_cls, views=None):
+        self.key = key
+        self.record_cls = record_cls
+        self._records = {}
+        self._predicates = dict(views or {})
+        self._views = {name: {} for name in self._predicates}
+
+    def add(self, item):
+        """Add an item if its key is new. Returns the stored record, or None if already present."""
+        record = self.record_cls.from_dict(item)
+        key = record[self.key]
+        if key in self._records:
+            return None
+        self._records[key] = record
+        self._index(key, record)
+        return record
+
+    def get(self, key, default=None):
+        return self._records.get(key, default)
+
+    def remove(self, key):
+        """Remove the record with this key, if present."""
+        self._records.pop(key, None)
+        for members in self._views.values():
+            members.pop(key, None)
+
+    def refresh(self, key):
+        """Re-evaluate view membership after a record was changed in place."""
+        record = self._records.get(key)
+        if record is not None:
+            self._index(key, record)
+
+    def clear(self):
+        self._records.clear()
+        for members in self._views.values():
+            members.clear()
+
+    def view(self, name):
+        """Records matching a named view, in insertion order."""
+        return [self._records[key] for key in self._views[name]]
+
+    def _index(self, key, record):
+        for name, predicate in self._predicates.items():
+            if predicate(record):
+                self._views[name][key] = True
+            else:
+                self._views[name].pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __iter__(self):
+        return iter(list(self._records.values()))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+
+def create_narrative_results_store():
+    """Store of classified narratives keyed by content hash."""
+    return NarrativeStore("hash", NarrativeRecord, views={
+        "sufficient_context": lambda narrative: narrative.get("narrative") != "Insufficient Context",
+    })
+
+
+def create_narrative_responses_store():
+    """Store of generated responses keyed by narrative id."""
+    return NarrativeStore("id", NarrativeResponseRecord)
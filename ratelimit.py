@@ -0,0 +1,275 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+import email.utils
+from contextlib import contextmanager
+
+from config import (
+    RATE_LIMITS,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BACKOFF_BASE,
+    RATE_LIMIT_BACKOFF_MAX,
+    RATE_LIMIT_MIN_FRACTION,
+    RATE_LIMIT_RECOVERY,
+)
+from metrics import record_span
+
+# Call priorities; lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Statuses worth retrying after a backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_priority = threading.local()
+
+
+@contextmanager
+def call_priority(priority):
+    """Run a block's rate-limited calls at ``priority`` on the current thread."""
+    previous = getattr(_priority, "value", None)
+    _priority.value = priority
+    try:
+        yield
+    finally:
+        _priority.value = previous
+
+
+def current_priority():
+    value = getattr(_priority, "value", None)
+    return INTERACTIVE if value is None else value
+
+
+def parse_duration(value):
+    """Seconds in an OpenAI-style reset duration such as ``"6m0s"``, ``"1.5s"`` or ``"20ms"``."""
+    total = 0.0
+    number = ""
+    position = 0
+    value = str(value).strip()
+    while position < len(value):
+        character = value[position]
+        if character.isdigit() or character == ".":
+            number += character
+            position += 1
+            continue
+        unit = "ms" if value.startswith("ms", position) else character
+        position += len(unit)
+        if not number:
+            return None
+        total += float(number) * {"h": 3600, "m": 60, "s": 1, "ms": 0.001}.get(unit, 0)
+        number = ""
+    return total + float(number) if number else total
+
+
+def retry_after_seconds(headers):
+    """Seconds a response asks callers to wait, from ``Retry-After`` style headers, or None."""
+    if not headers:
+        return None
+    headers = {str(name).lower(): value for name, value in headers.items()}
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def remaining_requests(headers):
+    """Requests left in the current window and seconds until it resets, from rate-limit headers."""
+    if not headers:
+        return None, None
+    headers = {str(name).lower(): value for name, value in headers.items()}
+    for remaining_name, reset_name in (
+        ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),  # OpenAI
+        ("ratelimit-remaining", "ratelimit-reset"),
+        ("x-ratelimit-remaining", "x-ratelimit-reset"),
+    ):
+        if remaining_name not in headers:
+            continue
+        try:
+            remaining = int(float(headers[remaining_name]))
+        except ValueError:
+            return None, None
+        reset = headers.get(reset_name)
+        seconds = parse_duration(reset) if reset is not None else None
+        if seconds and seconds > 1e9:
+            # An epoch timestamp rather than a duration
+            seconds = max(0.0, seconds - time.time())
+        return remaining, seconds
+    return None, None
+
+
+def error_response(error):
+    """Status code and headers of a failed HTTP call, if the error carries them."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    headers = getattr(error, "headers", None) or getattr(response, "headers", None) or {}
+    return status, headers
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the service's ``Retry-After``."""
+    delay = random.uniform(0, min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+class RateLimiter:
+    """Thread-safe adaptive token bucket shared by every caller of one service.
+
+    Waiting callers are served in priority order, then in arrival order, so
+    interactive calls overtake queued background work. When the service
+    throttles, the bucket pauses for its ``Retry-After`` and halves its refill
+    rate; every success then moves the rate back towards the configured one.
+    Exhausted rate-limit headers pause the bucket until the window resets.
+    """
+
+    def __init__(self, rate, capacity=None, service=None):
+        self.service = service
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate * RATE_LIMIT_MIN_FRACTION
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._waiting = []  # Heap of (priority, arrival) tickets
+        self._arrivals = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1, priority=None):
+        """Block until ``tokens`` requests may be issued and no caller ahead is waiting."""
+        priority = current_priority() if priority is None else priority
+        ticket = (priority, next(self._arrivals))
+        start = time.perf_counter()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    first = self._waiting[0] == ticket
+                    if first and now >= self.paused_until and self.tokens >= tokens:
+                        self.tokens -= tokens
+                        break
+                    if now < self.paused_until:
+                        delay = self.paused_until - now
+                    elif first:
+                        delay = (tokens - self.tokens) / self.rate
+                    else:
+                        delay = None  # Woken when a caller ahead is served
+                    self._condition.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+        record_span("ratelimit.wait", time.perf_counter() - start, service=self.service, priority=priority)
+
+    def pause(self, seconds):
+        """Hold every caller for ``seconds``."""
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def throttle(self, retry_after=None):
+        """Back off after the service throttled a call."""
+        with self._condition:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            self.throttled += 1
+        if retry_after:
+            self.pause(retry_after)
+
+    def success(self):
+        """Recover the refill rate a step after a call went through."""
+        with self._condition:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_LIMIT_RECOVERY)
+
+    def update_from_headers(self, status, headers):
+        """Adapt to a response: throttle on 429, pause while the rate-limit window is spent."""
+        if status == 429:
+            self.throttle(retry_after_seconds(headers))
+            return
+        remaining, reset = remaining_requests(headers)
+        if remaining is not None and remaining <= 0 and reset:
+            self.pause(reset)
+
+    def stats(self):
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "service": self.service,
+                "rate": round(self.rate, 2),
+                "max_rate": self.max_rate,
+                "tokens": round(self.tokens, 2),
+                "waiting": len(self._waiting),
+                "throttled": self.throttled,
+                "paused_for": round(max(0.0, self.paused_until - now), 1),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(service):
+    """Get the process-wide rate limiter for a service, e.g. ``"exa"``."""
+    with _limiters_lock:
+        if service not in _limiters:
+            _limiters[service] = RateLimiter(RATE_LIMITS[service], service=service)
+        return _limiters[service]
+
+
+def get_rate_limiter_stats():
+    """Current rate, tokens, queue length and throttle count of every limiter."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+def call_with_retry(service, function, *args, priority=None, max_retries=RATE_LIMIT_MAX_RETRIES,
+                    retry_statuses=RETRY_STATUSES, **kwargs):
+    """Call ``function`` through a service's rate limiter, retrying throttled and failed calls.
+
+    Calls failing with a retryable status are retried after a jittered
+    exponential backoff that honours the service's ``Retry-After``; a 429
+    also slows the shared limiter for every other caller.
+    """
+    limiter = get_rate_limiter(service)
+    attempt = 0
+    while True:
+        limiter.acquire(priority=priority)
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            status, headers = error_response(e)
+            if status not in retry_statuses or attempt >= max_retries:
+                raise
+            retry_after = retry_after_seconds(headers)
+            if status == 429:
+                limiter.throttle(retry_after)
+            delay = backoff_delay(attempt, retry_after)
+            print(f"{service} call failed with status {status}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        limiter.success()
+        return result
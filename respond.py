@@ -1,41 +1,21 @@
 import os
 import json
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from openai import OpenAI
 import streamlit as st
 
-from clients import get_openai_client
+from config import RESPONSE_STRATEGIES, VOICES, RESPONSE_MAX_WORKERS
+from llm import get_llm_backend
+from metrics import record_span, traced
 
 
+@traced("respond")
 def invoke_response_assistant(context, assistant_id):
     """Invoke the LLM Assistant with the given context."""
-    client = get_openai_client()  # Get client when needed
-    thread = client.beta.threads.create()
-    client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content=json.dumps(context)
-    )
-    run = client.beta.threads.runs.create_and_poll(
-        thread_id=thread.id,
-        assistant_id=assistant_id,
-    )
-    
-    if run.status == 'completed':
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-        return parse_assistant_message(messages)
-    else:
-        raise RuntimeError(f"An error occurred: {run.status}")
-
-def parse_assistant_message(messages):
-    """Parse assistant messages."""
-    for message in messages.data:
-        if message.role == "assistant":
-            try:
-                return message.content[0].text.value
-            except (json.JSONDecodeError, IndexError):
-                print("Error parsing assistant message content.")
-    return {}
+    return get_llm_backend().run(assistant_id, context)
 
 
 def generate_response(assistant_id, llm_context):
@@ -52,3 +32,103 @@ def generate_response(assistant_id, llm_context):
         print(f"Failed to generate response: {e}")
 
 
+def stream_response(assistant_id, llm_context):
+    """Invoke the assistant, yielding the response text as it is generated.
+
+    A failed stream is re-raised, so partial text is never taken for a response.
+    The stream is recorded as a finished span, as an open span would outlive
+    each ``yield``.
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield from get_llm_backend().stream(assistant_id, llm_context)
+    except Exception as e:
+        error = True
+        print(f"Failed to stream response: {e}")
+        raise
+    finally:
+        record_span("respond.stream", time.perf_counter() - start, error)
+
+
+def build_response_context(narrative, language):
+    """Build the response assistant context for a narrative."""
+    return {
+        "title": narrative['title'],
+        "narrative": narrative['narrative'],
+        "community": narrative['community'],
+        "content": narrative['content'],
+        "response_language": language
+    }
+
+
+def build_response_obj(content, strategy, voice, language):
+    """Wrap generated text in a Response object."""
+    return {
+        "content": content,
+        "strategy": strategy,
+        "voice": voice,
+        "language": language,
+        "timestamp": datetime.datetime.now().isoformat()
+    }
+
+
+def stream_response_variant(narrative, strategy, voice, language):
+    """Stream one response for a narrative with a strategy, voice and language.
+
+    With a voice selected, the strategy response is generated in full first
+    and the voice assistant's rewrite is what gets streamed.
+    """
+    llm_context = build_response_context(narrative, language)
+    if voice == "Default":
+        yield from stream_response(RESPONSE_STRATEGIES[strategy], llm_context)
+        return
+
+    res = generate_response(RESPONSE_STRATEGIES[strategy], llm_context)
+    if res:
+        yield from stream_response(VOICES[voice], res)
+
+
+def generate_response_variant(narrative, strategy, voice, language):
+    """Generate one response for a narrative with a strategy, voice and language.
+
+    Returns the response object, or None if generation failed.
+    """
+    res = generate_response(RESPONSE_STRATEGIES[strategy], build_response_context(narrative, language))
+    if not res:
+        return None
+
+    if voice != "Default":
+        res = generate_response(VOICES[voice], res)
+        if not res:
+            return None
+
+    return build_response_obj(res, strategy, voice, language)
+
+
+def generate_response_variants(narrative, strategies, voices, languages, max_workers=RESPONSE_MAX_WORKERS):
+    """Generate every strategy/voice/language combination for a narrative concurrently.
+
+    Yields ``(strategy, voice, language, response_obj, seconds)`` as each
+    variant finishes; ``response_obj`` is None when that variant failed.
+    """
+    variants = [(strategy, voice, language) for strategy in strategies for voice in voices for language in languages]
+    if not variants:
+        return
+
+    def timed_variant(strategy, voice, language):
+        start = time.perf_counter()
+        response_obj = generate_response_variant(narrative, strategy, voice, language)
+        return response_obj, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(variants)))) as executor:
+        futures = {executor.submit(timed_variant, *variant): variant for variant in variants}
+        for future in as_completed(futures):
+            strategy, voice, language = futures[future]
+            try:
+                response_obj, seconds = future.result()
+            except Exception as e:
+                print(f"Failed to generate {strategy}/{voice}/{language} response: {e}")
+                response_obj, seconds = None, 0.0
+            yield strategy, voice, language, response_obj, seconds
+
@@ -0,0 +1,145 @@
+import re
+import json
+import math
+import hashlib
+import threading
+from collections import Counter
+
+from config import RETRIEVAL_INDEX_TYPE, THREAD_MATCH_THRESHOLD, THREAD_MATCH_MARGIN
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lowercase word tokens of a text; hashtags match their bare words."""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def record_text(record):
+    """Flatten a worksheet record into searchable text."""
+    return " ".join(str(value) for value in record.values() if value not in (None, ""))
+
+
+class BM25Index:
+    """Okapi BM25 ranking over a fixed set of documents."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query):
+        query_terms = [term for term in set(tokenize(query)) if term in self.idf]
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.average_length) if self.average_length else self.k1
+            for term in query_terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            results.append(score)
+        return results
+
+
+class TfidfIndex:
+    """Cosine similarity between TF-IDF weighted term vectors."""
+
+    def __init__(self, documents):
+        term_counts = [Counter(tokenize(document)) for document in documents]
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        total = len(documents)
+        self.idf = {
+            term: math.log((1 + total) / (1 + frequency)) + 1
+            for term, frequency in document_frequency.items()
+        }
+        self.vectors = [self.vectorize(counts) for counts in term_counts]
+
+    def vectorize(self, counts):
+        vector = {term: frequency * self.idf[term] for term, frequency in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def scores(self, query):
+        query_vector = self.vectorize(Counter(tokenize(query)))
+        return [
+            sum(weight * vector.get(term, 0.0) for term, weight in query_vector.items())
+            for vector in self.vectors
+        ]
+
+
+INDEX_TYPES = {
+    "bm25": BM25Index,
+    "tfidf": TfidfIndex,
+}
+
+# Indexes built per worksheet snapshot: (name, index type) -> (fingerprint, index)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(name, records, index_type=RETRIEVAL_INDEX_TYPE):
+    """Get the index over a worksheet's records, rebuilding it only when the records change."""
+    fingerprint = hashlib.md5(json.dumps(records, sort_keys=True, default=str).encode()).hexdigest()
+    with _indexes_lock:
+        cached = _indexes.get((name, index_type))
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+    index = INDEX_TYPES[index_type]([record_text(record) for record in records])
+    with _indexes_lock:
+        _indexes[(name, index_type)] = (fingerprint, index)
+    return index
+
+
+def rank_records(name, records, query, index_type=RETRIEVAL_INDEX_TYPE):
+    """Return ``(score, record)`` pairs for every record, most relevant first."""
+    if not records:
+        return []
+    scores = get_index(name, records, index_type).scores(query)
+    order = sorted(range(len(records)), key=lambda position: scores[position], reverse=True)
+    return [(scores[position], records[position]) for position in order]
+
+
+def top_k_records(name, records, query, k, index_type=RETRIEVAL_INDEX_TYPE):
+    """Return the ``k`` records most relevant to the query, or all of them if ``k`` is not positive."""
+    if not records or k <= 0 or len(records) <= k:
+        return records
+    return [record for _, record in rank_records(name, records, query, index_type)[:k]]
+
+
+def thread_number(thread):
+    """Number of a Threads worksheet row, e.g. ``"12"`` for ``"Thread 12"``."""
+    return str(thread.get('Thread', '')).replace('Thread', '').strip()
+
+
+def build_thread_lookup(thread_data):
+    """Map thread numbers to their Threads worksheet rows."""
+    return {thread_number(thread): thread for thread in thread_data or []}
+
+
+def match_thread(text, thread_data, threshold=THREAD_MATCH_THRESHOLD, margin=THREAD_MATCH_MARGIN):
+    """Match a response to a thread by TF-IDF similarity with the thread topics.
+
+    Returns the best thread only when it is confident: its similarity reaches
+    ``threshold`` and beats the runner-up by at least ``margin``. Otherwise
+    returns None so the caller can fall back to the link assistant.
+    """
+    if not thread_data:
+        return None
+    topics = [{'Topic': thread.get('Topic', '')} for thread in thread_data]
+    scores = get_index('thread_topics', topics, "tfidf").scores(text)
+    ranked = sorted(range(len(scores)), key=lambda position: scores[position], reverse=True)
+    best = scores[ranked[0]]
+    runner_up = scores[ranked[1]] if len(ranked) > 1 else 0.0
+    if best >= threshold and best - runner_up >= margin:
+        return thread_data[ranked[0]]
+    return None
+
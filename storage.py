@@ -0,0 +1,384 @@
+import json
+import time
+import datetime
+import threading
+import gspread
+from functools import lru_cache
+
+from config import STORAGE_BACKEND, STORAGE_SYNC_TO_SHEETS, LOCAL_STORE_FILE, SHEETS_CACHE_TTL
+from database import (
+    setup_google_sheets, get_sheets, sheets_call, get_worksheet_records, invalidate_worksheet,
+    queue_write, queue_row_updates,
+)
+from local_store import get_connection
+from sync import SheetsSync, create_outbox, queue_rows
+
+# Worksheets behind the dashboard. Header names are the defaults for a fresh local
+# database; the indexed columns are 1-based positions, as written by the dashboard.
+# "sync_key" lists the columns identifying a row when syncing, if not just "key".
+# "reference" tables are maintained in the sheet and re-imported once stale.
+WORKSHEETS = {
+    "narrative": {
+        "table": "narrative_results",
+        "headers": ["Hash", "Title", "Narrative", "Community", "Link", "Content", "Hashtags", "Timestamp"],
+        "key": 1,
+        "date": 8,
+    },
+    "responses": {
+        "table": "responses",
+        "headers": [
+            "ID", "Date", "Title", "Original Post", "Link", "Response", "Strategy", "Hashtags", "Thread",
+            "Posted", "View Count", "Like Count", "Retweet Count", "Comments",
+        ],
+        "key": 1,
+        "date": 2,
+        "posted": 10,
+        # Variants of one narrative saved together share their ID and Date
+        "sync_key": [1, 2, 6],
+    },
+    "threads": {
+        "table": "threads",
+        "headers": ["Thread", "Topic", "Link"],
+        "key": 1,
+        "reference": True,
+    },
+    "hashtags": {
+        "table": "hashtags",
+        "headers": ["Hashtag"],
+        "key": 1,
+        "reference": True,
+    },
+}
+
+
+class StorageBackend:
+    """Durable worksheet-shaped tables: 'narrative', 'responses', 'threads' and 'hashtags'.
+
+    Rows are addressed like worksheet rows: row 1 holds the headers, so the first
+    record is row 2, and columns are 1-based.
+    """
+
+    name = None
+
+    def setup(self):
+        """Prepare the backend; returns False if it cannot be used."""
+        return True
+
+    def get_records(self, name, **kwargs):
+        """Return a table's records as dicts keyed by header, or None if unavailable."""
+        raise NotImplementedError
+
+    def append_rows(self, name, rows):
+        """Append rows of values in header order."""
+        raise NotImplementedError
+
+    def update_rows(self, name, updates):
+        """Update cells of many rows, given as ``{row: {col: value}}``."""
+        raise NotImplementedError
+
+    def refresh(self, name=None):
+        """Drop anything cached for one table, or all tables, so the next read is fresh."""
+
+    def sync_status(self):
+        """Rows waiting to reach Google Sheets and the sync lag, per worksheet."""
+        return []
+
+
+class SheetsStorage(StorageBackend):
+    """Google Sheets as the store, read through snapshots and written behind."""
+
+    name = "sheets"
+
+    def setup(self):
+        return setup_google_sheets()
+
+    def get_records(self, name, **kwargs):
+        return get_worksheet_records(name, **kwargs)
+
+    def append_rows(self, name, rows):
+        queue_write(name, 'append_rows', rows)
+
+    def update_rows(self, name, updates):
+        queue_row_updates(name, updates)
+
+    def refresh(self, name=None):
+        invalidate_worksheet(name)
+
+
+def is_posted_value(value):
+    return value is True or str(value).upper() == 'TRUE'
+
+
+class SqliteStorage(StorageBackend):
+    """Local SQLite tables as the store, optionally mirrored to Google Sheets.
+
+    Reads never touch Sheets, apart from re-importing the reference tables
+    (threads and hashtags) after ``SHEETS_CACHE_TTL``. When ``sync_to_sheets`` is
+    set, every write also queues its rows in the durable outbox pushed by
+    :class:`sync.SheetsSync`, and empty tables are seeded from their worksheet on
+    first use.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=LOCAL_STORE_FILE, sync_to_sheets=STORAGE_SYNC_TO_SHEETS):
+        self.path = path
+        self.sync_to_sheets = sync_to_sheets
+        self._seeded = set()
+        self._imported = {}  # Reference table name -> time of its last import
+        self._lock = threading.Lock()
+        self.sync = SheetsSync(self)
+        conn = self.connect()
+        try:
+            for name, schema in WORKSHEETS.items():
+                conn.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {schema['table']} (
+                        row_number INTEGER PRIMARY KEY,
+                        data TEXT NOT NULL,
+                        key TEXT,
+                        date TEXT,
+                        posted INTEGER NOT NULL DEFAULT 0,
+                        updated_at TEXT NOT NULL
+                    )
+                    """
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {schema['table']}_key ON {schema['table']} (key)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {schema['table']}_date ON {schema['table']} (date)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {schema['table']}_posted ON {schema['table']} (posted)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS worksheet_headers (
+                    name TEXT PRIMARY KEY,
+                    headers TEXT NOT NULL
+                )
+                """
+            )
+            create_outbox(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def connect(self):
+        return get_connection(self.path)
+
+    def setup(self):
+        if self.sync_to_sheets:
+            # Sheets is only a mirror here, so the dashboard still works without it
+            setup_google_sheets()
+            self.sync.start()
+        return True
+
+    def worksheet_names(self):
+        return list(WORKSHEETS)
+
+    def key_columns(self, name):
+        """Columns matching local rows to worksheet rows when syncing."""
+        schema = WORKSHEETS[name]
+        return schema.get("sync_key", [schema["key"]])
+
+    def get_headers(self, conn, name):
+        row = conn.execute("SELECT headers FROM worksheet_headers WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else list(WORKSHEETS[name]["headers"])
+
+    def index_values(self, name, values):
+        """The indexed key, date and posted columns of a row."""
+        schema = WORKSHEETS[name]
+
+        def column(position):
+            if position and position <= len(values):
+                return values[position - 1]
+            return None
+
+        key = column(schema.get("key"))
+        date = column(schema.get("date"))
+        return (
+            None if key is None else str(key),
+            None if date is None else str(date),
+            int(is_posted_value(column(schema.get("posted")))),
+        )
+
+    def get_records(self, name, **kwargs):
+        self.seed_from_sheets(name)
+        conn = self.connect()
+        try:
+            headers = self.get_headers(conn, name)
+            rows = conn.execute(
+                f"SELECT data FROM {WORKSHEETS[name]['table']} ORDER BY row_number"
+            ).fetchall()
+        finally:
+            conn.close()
+        records = []
+        for (data,) in rows:
+            values = json.loads(data)
+            values = values + [""] * (len(headers) - len(values))
+            records.append(dict(zip(headers, values)))
+        return records
+
+    def read_rows(self, name, row_numbers):
+        """Return ``{row: values}`` for the given rows that exist."""
+        conn = self.connect()
+        try:
+            rows = {}
+            for row in row_numbers:
+                current = conn.execute(
+                    f"SELECT data FROM {WORKSHEETS[name]['table']} WHERE row_number = ?", (row,)
+                ).fetchone()
+                if current is not None:
+                    rows[row] = json.loads(current[0])
+            return rows
+        finally:
+            conn.close()
+
+    def append_rows(self, name, rows):
+        if not rows:
+            return
+        self.seed_from_sheets(name)
+        table = WORKSHEETS[name]["table"]
+        updated_at = datetime.datetime.now().isoformat()
+        conn = self.connect()
+        try:
+            with self._lock, conn:
+                conn.execute("BEGIN IMMEDIATE")
+                last = conn.execute(f"SELECT MAX(row_number) FROM {table}").fetchone()[0]
+                next_row = (last or 1) + 1
+                conn.executemany(
+                    f"INSERT INTO {table} (row_number, data, key, date, posted, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (next_row + offset, json.dumps(list(values), default=str), *self.index_values(name, list(values)), updated_at)
+                        for offset, values in enumerate(rows)
+                    ]
+                )
+                if self.sync_to_sheets:
+                    queue_rows(conn, name, {next_row + offset: None for offset in range(len(rows))})
+        finally:
+            conn.close()
+        if self.sync_to_sheets:
+            self.sync.notify()
+
+    def update_rows(self, name, updates):
+        if not updates:
+            return
+        table = WORKSHEETS[name]["table"]
+        updated_at = datetime.datetime.now().isoformat()
+        conn = self.connect()
+        try:
+            with self._lock, conn:
+                conn.execute("BEGIN IMMEDIATE")
+                changed = {}
+                for row, cells in updates.items():
+                    current = conn.execute(f"SELECT data FROM {table} WHERE row_number = ?", (row,)).fetchone()
+                    if current is None:
+                        continue
+                    changed[row] = list(cells)
+                    values = json.loads(current[0])
+                    for col, value in cells.items():
+                        values += [""] * (col - len(values))
+                        values[col - 1] = value
+                    conn.execute(
+                        f"UPDATE {table} SET data = ?, key = ?, date = ?, posted = ?, updated_at = ? WHERE row_number = ?",
+                        (json.dumps(values, default=str), *self.index_values(name, values), updated_at, row)
+                    )
+                if self.sync_to_sheets:
+                    queue_rows(conn, name, changed)
+        finally:
+            conn.close()
+        if self.sync_to_sheets:
+            self.sync.notify()
+
+    def replace_rows(self, name, headers, rows):
+        """Replace a table's headers and rows, e.g. with a worksheet's contents."""
+        table = WORKSHEETS[name]["table"]
+        updated_at = datetime.datetime.now().isoformat()
+        conn = self.connect()
+        try:
+            with self._lock, conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(f"DELETE FROM {table}")
+                conn.execute(
+                    "INSERT OR REPLACE INTO worksheet_headers (name, headers) VALUES (?, ?)",
+                    (name, json.dumps(headers))
+                )
+                conn.executemany(
+                    f"INSERT INTO {table} (row_number, data, key, date, posted, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (position + 2, json.dumps(values, default=str), *self.index_values(name, values), updated_at)
+                        for position, values in enumerate(rows)
+                    ]
+                )
+        finally:
+            conn.close()
+
+    def import_from_sheets(self, name):
+        """Copy a worksheet into its local table; returns False if Sheets is unavailable."""
+        sheets = get_sheets()
+        if not sheets:
+            return False
+        # Queued local rows must reach the sheet first or the copy would drop them
+        self.sync.sync_worksheet(name)
+        values = sheets_call(name, 'get_all_values')
+        if not values:
+            return False
+        # Convert numbers the way get_all_records does
+        rows = [gspread.utils.numericise_all(row, default_blank="") for row in values[1:]]
+        self.replace_rows(name, values[0], rows)
+        return True
+
+    def uses_sheets(self, name):
+        """Whether a table is filled from its worksheet: every table when syncing, reference tables always."""
+        return self.sync_to_sheets or WORKSHEETS[name].get("reference", False)
+
+    def seed_from_sheets(self, name):
+        """Seed an empty table from its worksheet once per process; re-import stale reference tables."""
+        if not self.uses_sheets(name):
+            return
+        if WORKSHEETS[name].get("reference"):
+            now = time.monotonic()
+            if now - self._imported.get(name, float("-inf")) < SHEETS_CACHE_TTL:
+                return
+            self._imported[name] = now
+            try:
+                self.import_from_sheets(name)
+            except Exception as e:
+                print(f"Failed to import '{name}' from Google Sheets: {e}")
+            return
+        if name in self._seeded:
+            return
+        self._seeded.add(name)
+        conn = self.connect()
+        try:
+            empty = conn.execute(f"SELECT 1 FROM {WORKSHEETS[name]['table']} LIMIT 1").fetchone() is None
+        finally:
+            conn.close()
+        if empty:
+            try:
+                self.import_from_sheets(name)
+            except Exception as e:
+                print(f"Failed to seed '{name}' from Google Sheets: {e}")
+
+    def refresh(self, name=None):
+        # Pull edits made directly in the spreadsheet
+        for worksheet in ([name] if name else WORKSHEETS):
+            if not self.uses_sheets(worksheet):
+                continue
+            try:
+                invalidate_worksheet(worksheet)
+                if self.import_from_sheets(worksheet) and WORKSHEETS[worksheet].get("reference"):
+                    self._imported[worksheet] = time.monotonic()
+            except Exception as e:
+                print(f"Failed to refresh '{worksheet}' from Google Sheets: {e}")
+
+    def sync_status(self):
+        return self.sync.status() if self.sync_to_sheets else []
+
+
+STORAGE_BACKENDS = {
+    "sheets": SheetsStorage,
+    "sqlite": SqliteStorage,
+}
+
+
+@lru_cache(maxsize=None)
+def get_storage(name=STORAGE_BACKEND):
+    """Get the process-wide storage backend configured by STORAGE_BACKEND."""
+    return STORAGE_BACKENDS[name]()
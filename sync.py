@@ -0,0 +1,262 @@
+import json
+import time
+import random
+import threading
+
+from config import SYNC_INTERVAL, SYNC_BACKOFF_BASE, SYNC_BACKOFF_MAX
+from database import get_sheets, sheets_call, build_batch_update
+from ratelimit import call_priority, BACKGROUND
+
+
+def create_outbox(conn):
+    """Create the table of local rows still to be pushed to Google Sheets."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_outbox (
+            name TEXT NOT NULL,
+            row_number INTEGER NOT NULL,
+            columns TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            queued_at REAL NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            PRIMARY KEY (name, row_number)
+        )
+        """
+    )
+
+
+def queue_rows(conn, name, rows):
+    """Queue changed rows inside the caller's transaction.
+
+    ``rows`` maps row numbers to the changed column numbers, or None for a whole
+    row. A row queued again keeps its first queued time, so the sync lag covers
+    its oldest unsynced change.
+    """
+    queued_at = time.time()
+    for row, columns in rows.items():
+        current = conn.execute(
+            "SELECT columns FROM sync_outbox WHERE name = ? AND row_number = ?", (name, row)
+        ).fetchone()
+        if current is None:
+            conn.execute(
+                "INSERT INTO sync_outbox (name, row_number, columns, queued_at) VALUES (?, ?, ?, ?)",
+                (name, row, None if columns is None else json.dumps(sorted(columns)), queued_at)
+            )
+            continue
+        if current[0] is None or columns is None:
+            merged = None
+        else:
+            merged = json.dumps(sorted(set(json.loads(current[0])) | set(columns)))
+        conn.execute(
+            "UPDATE sync_outbox SET columns = ?, version = version + 1 WHERE name = ? AND row_number = ?",
+            (merged, name, row)
+        )
+
+
+def cell_text(value):
+    """A local value as Google Sheets displays it, for comparing with worksheet values."""
+    if value is None:
+        return ""
+    if value is True:
+        return "TRUE"
+    if value is False:
+        return "FALSE"
+    return str(value)
+
+
+def row_key(values, key_columns):
+    """The cell texts of a row's key columns, or None if they are all blank."""
+    key = tuple(cell_text(values[col - 1]) if col <= len(values) else "" for col in key_columns)
+    return key if any(key) else None
+
+
+def diff_rows(local, remote, columns, key_columns):
+    """Compare local rows with a worksheet's values, matching rows by their key columns.
+
+    ``local`` maps local row numbers to values, ``remote`` is ``get_all_values()``
+    (row 1 holds the headers), ``columns`` maps local row numbers to the changed
+    columns, or None for a whole row, and ``key_columns`` are the 1-based columns
+    identifying a row. Rows are matched by key rather than position, so rows added,
+    removed or sorted directly in the sheet never shift changes onto other rows.
+    Unmatched whole rows are appended; changed cells of a row no longer in the
+    sheet are dropped. Returns the rows to append and ``{(row, col): value}`` for
+    cells that differ, addressed by worksheet row.
+    """
+    remote_rows = {}
+    for position, values in enumerate(remote[1:], start=2):
+        key = row_key(values, key_columns)
+        if key is not None:
+            remote_rows.setdefault(key, position)
+
+    cells = {}
+    appends = []
+    for row in sorted(local):
+        values = local[row]
+        key = row_key(values, key_columns)
+        target = remote_rows.get(key) if key is not None else None
+        if target is None:
+            if columns.get(row) is None:
+                appends.append(values)
+                if key is not None:
+                    # A later row with the same key updates this one instead of appending again
+                    remote_rows[key] = len(remote) + len(appends)
+            continue
+        if target > len(remote):
+            continue
+        remote_values = remote[target - 1]
+        for col in columns.get(row) or range(1, len(values) + 1):
+            value = values[col - 1] if col <= len(values) else ""
+            remote_value = remote_values[col - 1] if col <= len(remote_values) else ""
+            if cell_text(value) != remote_value:
+                cells[(target, col)] = value
+    return appends, cells
+
+
+class SheetsSync:
+    """Background worker that pushes rows changed in a local store to Google Sheets.
+
+    Changed rows are recorded in the durable ``sync_outbox`` table in the same
+    transaction as the change, so a crash or restart resumes where it left off.
+    Each pass matches the queued rows to worksheet rows by their key columns and
+    sends only missing rows (one ``append_rows``) and changed cells (one ``batch_update``), through
+    the "sheets" rate limiter at background priority, backing off exponentially
+    with jitter while Sheets fails.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.last_success = None
+        self.last_error = None
+        self.failures = 0
+        self._wake = threading.Event()
+        self._sync_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread if it is not already running."""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sheets-sync", daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """Wake the worker after rows were queued."""
+        self._wake.set()
+
+    def _run(self):
+        with call_priority(BACKGROUND):
+            while True:
+                self._wake.wait(SYNC_INTERVAL)
+                self._wake.clear()
+                try:
+                    ok = self.sync_pending()
+                except Exception as e:
+                    # E.g. the outbox could not be read; keep the worker alive and retry
+                    ok = False
+                    self.failures += 1
+                    self.last_error = f"outbox: {e}"
+                    print(f"Failed to read the Google Sheets sync outbox: {e}")
+                if ok:
+                    self.failures = 0
+                else:
+                    # Keep the queued rows and retry later, backing off while Sheets keeps failing
+                    delay = min(SYNC_BACKOFF_MAX, SYNC_BACKOFF_BASE * 2 ** (self.failures - 1))
+                    time.sleep(random.uniform(delay / 2, delay))
+
+    def sync_pending(self):
+        """Push every worksheet with queued rows; returns False if any push failed."""
+        conn = self.storage.connect()
+        try:
+            names = [row[0] for row in conn.execute("SELECT DISTINCT name FROM sync_outbox")]
+        finally:
+            conn.close()
+        ok = True
+        for name in names:
+            try:
+                self.sync_worksheet(name)
+            except Exception as e:
+                ok = False
+                print(f"Failed to sync '{name}' to Google Sheets: {e}")
+        return ok
+
+    def sync_worksheet(self, name):
+        """Push the queued rows of one worksheet, raising if Sheets rejects them."""
+        with self._sync_lock:
+            conn = self.storage.connect()
+            try:
+                pending = conn.execute(
+                    "SELECT row_number, columns, version FROM sync_outbox WHERE name = ?", (name,)
+                ).fetchall()
+            finally:
+                conn.close()
+            if not pending:
+                return
+            try:
+                if not get_sheets():
+                    raise RuntimeError("Google Sheets is unavailable")
+
+                remote = sheets_call(name, 'get_all_values')
+
+                columns = {row: None if cols is None else json.loads(cols) for row, cols, _ in pending}
+                local = self.storage.read_rows(name, sorted(columns))
+                appends, cells = diff_rows(local, remote, columns, self.storage.key_columns(name))
+
+                if appends:
+                    sheets_call(name, 'append_rows', appends)
+                if cells:
+                    sheets_call(name, 'batch_update', build_batch_update(cells), value_input_option="USER_ENTERED")
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f"{name}: {e}"
+                conn = self.storage.connect()
+                try:
+                    with conn:
+                        conn.execute(
+                            "UPDATE sync_outbox SET attempts = attempts + 1, last_error = ? WHERE name = ?",
+                            (str(e), name)
+                        )
+                finally:
+                    conn.close()
+                raise
+
+            conn = self.storage.connect()
+            try:
+                with conn:
+                    # Rows queued again while this push was in flight stay for the next pass
+                    conn.executemany(
+                        "DELETE FROM sync_outbox WHERE name = ? AND row_number = ? AND version = ?",
+                        [(name, row, version) for row, _, version in pending]
+                    )
+            finally:
+                conn.close()
+            self.failures = 0
+            self.last_success = time.time()
+
+    def status(self):
+        """Queued rows and sync lag per worksheet."""
+        conn = self.storage.connect()
+        try:
+            rows = conn.execute(
+                """
+                SELECT name, COUNT(*), MIN(queued_at), MAX(attempts), MAX(last_error)
+                FROM sync_outbox GROUP BY name
+                """
+            ).fetchall()
+        finally:
+            conn.close()
+        now = time.time()
+        pending = {name: (count, oldest, attempts, error) for name, count, oldest, attempts, error in rows}
+        summary = []
+        for name in self.storage.worksheet_names():
+            count, oldest, attempts, error = pending.get(name, (0, None, 0, None))
+            summary.append({
+                "worksheet": name,
+                "pending_rows": count,
+                "lag_seconds": round(now - oldest, 1) if oldest else 0.0,
+                "attempts": attempts,
+                "last_error": error or (self.last_error if self.failures else "") or "",
+                "last_success": time.strftime("%H:%M:%S", time.localtime(self.last_success)) if self.last_success else "never",
+            })
+        return summary
@@ -9,6 +9,7 @@ class Response(TypedDict):
     content: str
     strategy: str
     voice: str
+    language: str
     timestamp: str
 
 class OriginalPost(TypedDict):
@@ -24,4 +25,83 @@ class NarrativeResponse(TypedDict):
     original_post: OriginalPost
     responses: List[Response]
     hashtags: List[str]
-    thread: Optional[dict]
\ No newline at end of file
+    thread: Optional[dict]
+
+class Record:
+    """Compact slot-based record with dict-style access, mirroring a TypedDict above.
+
+    Unset fields behave like missing keys, so existing ``record["field"]`` and
+    ``record.get("field", default)`` code keeps working.
+    """
+    __slots__ = ()
+    nested = {}
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            self[name] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a dict, converting nested dicts and dropping unknown keys."""
+        if isinstance(data, cls):
+            return data
+        record = cls()
+        for name, value in data.items():
+            if name not in cls.__slots__:
+                continue
+            nested_cls = cls.nested.get(name)
+            if nested_cls is not None and isinstance(value, list):
+                value = [nested_cls.from_dict(item) for item in value]
+            elif nested_cls is not None and isinstance(value, dict):
+                value = nested_cls.from_dict(value)
+            setattr(record, name, value)
+        return record
+
+    def to_dict(self):
+        """Convert the record, and any nested records, back to plain dicts."""
+        def convert(value):
+            if isinstance(value, Record):
+                return value.to_dict()
+            if isinstance(value, list):
+                return [convert(item) for item in value]
+            return value
+        return {name: convert(self[name]) for name in self.keys()}
+
+    def keys(self):
+        return [name for name in self.__slots__ if hasattr(self, name)]
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __getitem__(self, key):
+        if key not in self.__slots__ or not hasattr(self, key):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class ResponseRecord(Record):
+    __slots__ = ("content", "strategy", "voice", "language", "timestamp")
+
+class OriginalPostRecord(Record):
+    __slots__ = ("title", "narrative", "community", "link", "content", "date")
+
+class NarrativeResponseRecord(Record):
+    __slots__ = ("id", "original_post", "responses", "hashtags", "thread")
+    nested = {"original_post": OriginalPostRecord, "responses": ResponseRecord}
+
+class NarrativeRecord(Record):
+    """A classified narrative artefact as shown in the Search tab."""
+    __slots__ = ("hash", "title", "narrative", "community", "link", "content", "insufficient_context", "hashtags", "thread", "duplicates", "found_at")